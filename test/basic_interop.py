@@ -19,6 +19,8 @@ from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import *
 
 from interopUtils import *
+from interopSync import SyncWaiter, zmqArgs
+from interopLatency import PropagationRecorder
 
 # number of block used for generate function
 num_blocks = 20
@@ -47,7 +49,9 @@ class CTest(BitcoinTestFramework):
         self.clientDirs = client_dirs
         # override the binaries
         self.bins = [ os.path.join(base_dir, x, self.buildVariant, "src","bitcoind") for x in clientDirs]
-
+        # measure the block and transaction propagation between the clients
+        self.measureLatency = False
+        self.recorder = None
 
     def setup_chain(self,bitcoinConfDict=None, wallets=None):
         logging.info("Initializing test directory "+self.options.tmpdir)
@@ -56,7 +60,9 @@ class CTest(BitcoinTestFramework):
     def setup_network(self, split=False):
         bins = [ os.path.join(base_dir, x, self.buildVariant, "src","bitcoind") for x in clientDirs]
         logging.info(bins)
-        self.nodes = start_nodes(len(self.clientDirs), self.options.tmpdir,binary=bins, timewait=60*60)
+        notify = zmqArgs(bins)
+        self.nodes = start_nodes(len(self.clientDirs), self.options.tmpdir, notify, binary=bins, timewait=60*60)
+        self.waiter = SyncWaiter(self.nodes, notify)
 
         # Connect each node to the other
         connect_nodes_bi(self.nodes,0,1)
@@ -70,7 +76,12 @@ class CTest(BitcoinTestFramework):
         self.sync_all()
 
     def run_test(self):
+        if self.measureLatency:
+            self.recorder = PropagationRecorder(self.waiter, self.clientDirs)
+            self.recorder.mark("basic")
         self.test1()
+        if self.recorder:
+            self.recorder.save(os.path.join(self.options.tmpdir, "latency.json"))
         reporter.display_report()
 
     @assert_capture()
@@ -79,8 +90,8 @@ class CTest(BitcoinTestFramework):
         logging.info("Verify that all nodes are connected")
         verifyInterconnect(self.nodes)
 
-        logging.info("block count: %s" % ([ x.getblockcount() for x in self.nodes]))
-        logging.info("Connection count: %s" % ([ x.getconnectioncount() for x in self.nodes]))
+        logging.info("block count: %s" % (NodeGroup(self.nodes).getblockcount()))
+        logging.info("Connection count: %s" % (NodeGroup(self.nodes).getconnectioncount()))
 
         # #########
         logging.info("Verify that every node can produce blocks and that every other node receives them")
@@ -94,7 +105,7 @@ class CTest(BitcoinTestFramework):
         #self.nodes[3].generate(10, pubkey)
         #sync_blocks(self.nodes)
 
-        logging.info("block count: %s" % ([ x.getblockcount() for x in self.nodes]))
+        logging.info("block count: %s" % (NodeGroup(self.nodes).getblockcount()))
 
         # #########
         print("Verify main chain blocklen, status, and height after sync_blocks")
@@ -114,12 +125,12 @@ class CTest(BitcoinTestFramework):
             n.sendtoaddress(addr, 1)
             sync_mempools(self.nodes)
 
-        logging.info("mempool counts: %s" % [ x.getmempoolinfo()["size"] for x in self.nodes])
+        logging.info("mempool counts: %s" % [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()])
 
         logging.info("Verify that a block with P2PKH txns is accepted by all nodes and clears the mempool on all nodes")
         self.nodes[0].generate(1)
         sync_blocks(self.nodes)
-        logging.info("mempool counts: %s" % [ x.getmempoolinfo()["size"] for x in self.nodes])
+        logging.info("mempool counts: %s" % [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()])
 
 
 def Test():
@@ -136,6 +147,9 @@ def Test():
         if "--tmpdir=" in arg:
             tmpdir = str(arg)
             logging.info("# User input : %s" %tmpdir)
+        if arg == "--latency":
+            t.measureLatency = True
+            logging.info("Propagation latencies are measured")
 
     t.main([tmpdir], bitcoinConf, None)
 
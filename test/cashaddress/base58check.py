@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Base58 and Base58Check encoding and decoding of legacy addresses.
+    Both directions are bytes in, bytes out (str input is also accepted by the
+    decoders). Errors are reported with ValueError.
+
+    Digits are converted ten at a time: 58**10 fits in 64 bits, so a whole
+    chunk is folded into the big integer with a single multiply instead of one
+    multiply per character.
+
+    Usages:
+
+    from cashaddress import base58check
+
+    payload = base58check.b58decode_check(b'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp')
+    address = base58check.b58encode_check(payload)
+
+    Reference:
+    https://en.bitcoin.it/wiki/Base58Check_encoding
+"""
+from hashlib import sha256
+
+ALPHABET = b'123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+# reverse lookup: ASCII code to digit value, 255 marks characters not in the alphabet
+DECODE_MAP = bytearray(b'\xff' * 256)
+for value, char in enumerate(ALPHABET):
+    DECODE_MAP[char] = value
+DECODE_MAP = bytes(DECODE_MAP)
+
+CHUNK_DIGITS = 10
+CHUNK_BASE = 58 ** CHUNK_DIGITS
+
+# every two-digit pair, least significant digit first, so that a chunk is
+# emitted with five small divisions
+PAIR_BASE = 58 * 58
+PAIRS = [bytes((ALPHABET[i % 58], ALPHABET[i // 58])) for i in range(PAIR_BASE)]
+
+def b58encode(data):
+    data = bytes(data)
+    stripped = data.lstrip(b'\0')
+    pad = len(data) - len(stripped)
+    n = int.from_bytes(stripped, 'big')
+    out = bytearray()
+    while n:
+        n, chunk = divmod(n, CHUNK_BASE)
+        for _ in range(CHUNK_DIGITS // 2):
+            chunk, pair = divmod(chunk, PAIR_BASE)
+            out += PAIRS[pair]
+    # the last chunk was emitted with leading zero digits, drop them
+    while out and out[-1] == ALPHABET[0]:
+        out.pop()
+    out.extend(ALPHABET[0:1] * pad)
+    out.reverse()
+    return bytes(out)
+
+def decode_digits(data):
+    """decode Base58 without raising, None when data has characters outside the alphabet"""
+    if isinstance(data, str):
+        # anything that is not ASCII becomes '?', which is not a base58 digit
+        data = data.encode('ascii', 'replace')
+    digits = bytes(data).translate(DECODE_MAP)
+    if b'\xff' in digits:
+        return None
+    stripped = digits.lstrip(b'\0')
+    pad = len(digits) - len(stripped)
+    n = 0
+    head = len(stripped) % CHUNK_DIGITS
+    if head:
+        for digit in stripped[:head]:
+            n = n * 58 + digit
+    for start in range(head, len(stripped), CHUNK_DIGITS):
+        chunk = 0
+        for digit in stripped[start:start + CHUNK_DIGITS]:
+            chunk = chunk * 58 + digit
+        n = n * CHUNK_BASE + chunk
+    return b'\0' * pad + n.to_bytes((n.bit_length() + 7) // 8, 'big')
+
+def b58decode(data):
+    decoded = decode_digits(data)
+    if decoded is None:
+        raise ValueError('Invalid character in base58 string')
+    return decoded
+
+def checksum(data):
+    return sha256(sha256(data).digest()).digest()[:4]
+
+def b58encode_check(data):
+    data = bytes(data)
+    return b58encode(data + checksum(data))
+
+def check_payload(data):
+    """Base58Check decode without raising, None when data is not valid"""
+    decoded = decode_digits(data)
+    if decoded is None or len(decoded) < 4:
+        return None
+    payload = decoded[:-4]
+    if checksum(payload) != decoded[-4:]:
+        return None
+    return payload
+
+def b58decode_check(data):
+    decoded = b58decode(data)
+    if len(decoded) < 4:
+        raise ValueError('Base58Check string too short')
+    payload, check = decoded[:-4], decoded[-4:]
+    if checksum(payload) != check:
+        raise ValueError('Invalid Base58Check checksum')
+    return payload
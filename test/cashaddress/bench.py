@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Microbenchmarks for cashaddress encoding, decoding and validation.
+
+    Every benchmark reports its throughput and per-call latency as JSON. The
+    results are compared against bench_baseline.json: a benchmark whose
+    throughput dropped by more than the tolerance is reported as a regression
+    and the exit code is 1, so this can gate speed work on crypto.py and
+    convert.py. Baselines only make sense on the machine that recorded them,
+    re-record them with --save-baseline when moving to a new machine.
+
+    Usages:
+
+    # run everything and compare with the stored baselines
+    ./bench.py
+
+    # only the single address conversions, results written to a file
+    ./bench.py --filter=convert --output=results.json
+
+    # quick run of the bulk conversions without the 1M address pool
+    ./bench.py --filter=bulk --sizes=1000,100000
+
+    # record new baselines
+    ./bench.py --save-baseline
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+sourcePath = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(sourcePath)
+import convert
+from base58check import b58encode_check
+
+BASELINE_FILE = os.path.join(sourcePath, "bench_baseline.json")
+BULK_SIZES = [1000, 100000, 1000000]
+# allowed throughput drop against the baseline before a benchmark counts as a regression
+TOLERANCE = 0.25
+# minimum wall time of one timing run of a single-call benchmark
+MIN_RUN_TIME = 0.2
+REPEATS = 5
+
+# (network, kind, legacy version byte, regtest argument of convert)
+NETWORKS = [
+    ("mainnet", "p2pkh", 0, 0),
+    ("mainnet", "p2sh", 5, 0),
+    ("testnet", "p2pkh", 111, 0),
+    ("testnet", "p2sh", 196, 0),
+    ("regtest", "p2pkh", 111, 1),
+    ("regtest", "p2sh", 196, 1),
+]
+
+def make_legacy_addresses(version_int, count, seed):
+    rng = random.Random(seed)
+    return [b58encode_check(bytes((version_int,)) + bytes(rng.getrandbits(8) for _ in range(20))).decode('ascii')
+            for _ in range(count)]
+
+def corrupt(address, seed):
+    """flip one character of an address, which breaks its checksum"""
+    rng = random.Random(seed)
+    i = rng.randrange(len(address) - 8, len(address))
+    alphabet = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l' if ':' in address else '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+    replacement = rng.choice(alphabet.replace(address[i], ''))
+    return address[:i] + replacement + address[i + 1:]
+
+def time_calls(func, args):
+    """
+    Call func once for every item of args, repeat until a run takes at least
+    MIN_RUN_TIME, return the best time per call over REPEATS runs
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            for arg in args:
+                func(arg)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_TIME:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for arg in args:
+                func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best / (loops * len(args))
+
+def time_bulk(func, pool, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(pool)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(pool)
+
+def result(per_call, calls=1):
+    return {"ops_per_sec": round(calls / per_call, 1), "ns_per_op": round(per_call * 1e9 / calls, 1)}
+
+def single_benchmarks():
+    """name and zero-argument runner of every single address benchmark"""
+    benchmarks = []
+    for network, kind, version_int, regtest in NETWORKS:
+        legacy = make_legacy_addresses(version_int, 100, version_int + regtest)
+        cash = [convert.to_cash_address(x, regtest) for x in legacy]
+        name = "%s.%s" % (network, kind)
+        benchmarks.append(("convert.to_cash.%s" % name,
+                           lambda legacy=legacy, regtest=regtest: time_calls(lambda x: convert.to_cash_address(x, regtest), legacy)))
+        benchmarks.append(("convert.to_legacy.%s" % name,
+                           lambda cash=cash, regtest=regtest: time_calls(lambda x: convert.to_legacy_address(x, regtest), cash)))
+        benchmarks.append(("is_valid.good.cash.%s" % name, lambda cash=cash: time_calls(convert.is_valid, cash)))
+        benchmarks.append(("is_valid.good.legacy.%s" % name, lambda legacy=legacy: time_calls(convert.is_valid, legacy)))
+        bad_cash = [corrupt(x, i) for i, x in enumerate(cash)]
+        bad_legacy = [corrupt(x, i) for i, x in enumerate(legacy)]
+        benchmarks.append(("is_valid.bad.cash.%s" % name, lambda bad_cash=bad_cash: time_calls(convert.is_valid, bad_cash)))
+        benchmarks.append(("is_valid.bad.legacy.%s" % name, lambda bad_legacy=bad_legacy: time_calls(convert.is_valid, bad_legacy)))
+    return benchmarks
+
+def bulk_benchmarks(sizes):
+    benchmarks = []
+    for size in sizes:
+        repeats = 3 if size < 1000000 else 1
+
+        def run_to_cash(size=size, repeats=repeats):
+            pool = make_legacy_addresses(111, size, size)
+            return time_bulk(lambda p: convert.to_cash_addresses(p, 1), pool, repeats)
+
+        def run_to_legacy(size=size, repeats=repeats):
+            pool = convert.to_cash_addresses(make_legacy_addresses(111, size, size), 1)
+            return time_bulk(lambda p: convert.to_legacy_addresses(p, 1), pool, repeats)
+
+        def run_are_valid(size=size, repeats=repeats):
+            pool = convert.to_cash_addresses(make_legacy_addresses(111, size, size), 1)
+            return time_bulk(convert.are_valid, pool, repeats)
+
+        benchmarks.append(("bulk.to_cash.%d" % size, run_to_cash))
+        benchmarks.append(("bulk.to_legacy.%d" % size, run_to_legacy))
+        benchmarks.append(("bulk.are_valid.%d" % size, run_are_valid))
+    return benchmarks
+
+def compare(results, baseline, tolerance):
+    """return the names of the benchmarks slower than their baseline by more than tolerance"""
+    regressions = []
+    for name, measured in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = measured["ops_per_sec"] / reference["ops_per_sec"]
+        measured["baseline_ratio"] = round(ratio, 3)
+        if ratio < 1.0 - tolerance:
+            regressions.append(name)
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="cashaddress microbenchmarks")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this string")
+    parser.add_argument("--sizes", default=",".join(str(x) for x in BULK_SIZES), help="comma separated bulk pool sizes")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed throughput drop, 0.25 is 25%%")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file instead of stdout")
+    options = parser.parse_args(argv)
+
+    sizes = [int(x) for x in options.sizes.split(",") if x]
+    results = {}
+    for name, run in single_benchmarks() + bulk_benchmarks(sizes):
+        if options.filter not in name:
+            continue
+        results[name] = result(run())
+        print("%-40s %12.1f ops/s %10.1f ns/op" % (name, results[name]["ops_per_sec"], results[name]["ns_per_op"]), file=sys.stderr)
+
+    regressions = []
+    if options.save_baseline:
+        baseline = {}
+        if os.path.exists(options.baseline):
+            with open(options.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(options.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+
+    report = {"results": results, "regressions": regressions}
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    for name in regressions:
+        print("REGRESSION %s: %.0f%% of baseline" % (name, 100 * results[name]["baseline_ratio"]), file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Bounded least-recently-used cache for decoded addresses and the output
+    scripts built from them.
+
+    Usages:
+
+    from cashaddress.cache import LRUCache
+
+    cache = LRUCache(1024)
+    script = cache.lookup((address, 'regtest', 'p2pkh'), lambda: p2pkh(address))
+    print(cache.hits, cache.misses)
+"""
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError('LRUCache size must be at least 1')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __str__(self):
+        return 'size: {}/{}\nhits: {}\nmisses: {}'.format(len(self.entries), self.maxsize, self.hits, self.misses)
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key, build):
+        """return the cached value for key, calling build() to create it on a miss"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = build()
+            self.put(key, value)
+            return value
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
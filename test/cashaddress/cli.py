@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Streaming bulk conversion and validation of address lists.
+
+    Reads one address per line from a file or stdin and writes one result per
+    line, in input order, so the output can be pasted next to the input.
+    Files are memory-mapped and cut in chunks at line boundaries, every chunk
+    is converted by a worker process. stdin is cut in chunks of lines instead.
+    Blank lines and lines starting with '#' are copied unchanged. An address
+    that cannot be converted gives an empty line and the exit code is 1.
+
+    Modes:
+        cash     : cash address of every address
+        legacy   : legacy address of every address
+        hash160  : hex hash160 of every address
+        validate : 1 for a valid address, 0 otherwise
+
+    Usages:
+
+    # re-encode a wallet dump from a regtest node using all cores
+    ./cli.py cash --regtest --column=4 wallet.dump > wallet.cash
+
+    # check a list of addresses read from stdin
+    cat addresses.txt | ./cli.py validate
+
+    # convert with 2 workers, results written to a file
+    ./cli.py legacy --jobs=2 --output=legacy.txt cash.txt
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import sys
+sourcePath = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(sourcePath)
+import convert
+
+# size in bytes of the chunks of a memory-mapped file handed to a worker
+CHUNK_BYTES = 4 * 1024 * 1024
+# number of lines of stdin handed to a worker
+CHUNK_LINES = 50000
+# dumpwallet writes the address of a key as 'addr=<address>'
+ADDRESS_TAGS = ('addr=',)
+
+def to_hash160_hex(address, regtest=0):
+    return convert.to_hash160(address, regtest).hex()
+
+def validate(address, regtest=0):
+    return '1' if convert.is_valid(address) else '0'
+
+CONVERTERS = {
+    'cash': convert.to_cash_address,
+    'legacy': convert.to_legacy_address,
+    'hash160': to_hash160_hex,
+    'validate': validate,
+}
+
+def extract_address(line, column):
+    """address in a line of input, or None when the line has to be copied unchanged"""
+    if not line or line.startswith('#'):
+        return None
+    fields = line.split()
+    if column >= len(fields):
+        return None
+    field = fields[column]
+    for tag in ADDRESS_TAGS:
+        if field.startswith(tag):
+            return field[len(tag):]
+    return field
+
+def convert_lines(lines, mode, regtest, column):
+    """
+    Convert a list of input lines, return the output text of the chunk and
+    the number of addresses that could not be converted
+    """
+    converter = CONVERTERS[mode]
+    out = []
+    failed = 0
+    for line in lines:
+        line = line.strip()
+        address = extract_address(line, column)
+        if address is None:
+            out.append(line)
+            continue
+        try:
+            out.append(converter(address, regtest))
+        except convert.InvalidAddress:
+            out.append('')
+            failed += 1
+    out.append('')
+    return '\n'.join(out), failed
+
+# set in every worker process by init_worker
+worker = {}
+
+def init_worker(path, mode, regtest, column):
+    worker['path'] = path
+    worker['mode'] = mode
+    worker['regtest'] = regtest
+    worker['column'] = column
+
+def convert_range(bounds):
+    """convert the lines of a byte range of the file, mapped for the time of the chunk only"""
+    start, end = bounds
+    with open(worker['path'], 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            lines = data[start:end].decode('ascii', 'replace').splitlines()
+    return convert_lines(lines, worker['mode'], worker['regtest'], worker['column'])
+
+def convert_chunk(lines):
+    return convert_lines(lines, worker['mode'], worker['regtest'], worker['column'])
+
+def file_chunks(data, chunk_bytes):
+    """(start, end) byte ranges of data, each ending right after a newline or at the end of data"""
+    start = 0
+    size = len(data)
+    while start < size:
+        end = data.find(b'\n', min(start + chunk_bytes, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+def stream_chunks(stream, chunk_lines):
+    lines = []
+    for line in stream:
+        lines.append(line)
+        if len(lines) == chunk_lines:
+            yield lines
+            lines = []
+    if lines:
+        yield lines
+
+def run(path, stream, out, mode, regtest=0, column=0, jobs=None, chunk_bytes=CHUNK_BYTES, chunk_lines=CHUNK_LINES):
+    """
+    Convert every line of the file at path, or of stream when path is None,
+    and write the results to out in input order. Returns the number of
+    addresses that could not be converted.
+    """
+    if path is not None and os.path.getsize(path) == 0:
+        return 0
+    initargs = (path, mode, regtest, column)
+    if path is not None:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                chunks = list(file_chunks(data, chunk_bytes))
+        task = convert_range
+    else:
+        chunks = stream_chunks(stream, chunk_lines)
+        task = convert_chunk
+    failed = 0
+    if jobs == 1:
+        init_worker(*initargs)
+        for text, bad in map(task, chunks):
+            out.write(text)
+            failed += bad
+        return failed
+    with multiprocessing.Pool(jobs, init_worker, initargs) as pool:
+        # imap keeps the input order while the workers run ahead
+        for text, bad in pool.imap(task, chunks):
+            out.write(text)
+            failed += bad
+    return failed
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="bulk cashaddress conversion")
+    parser.add_argument("mode", choices=sorted(CONVERTERS), help="conversion to apply to every address")
+    parser.add_argument("input", nargs="?", default="-", help="file with one address per line, - for stdin")
+    parser.add_argument("--regtest", action="store_true", help="addresses are regtest addresses")
+    parser.add_argument("--column", type=int, default=0, help="whitespace separated column holding the address")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes, all cores by default")
+    parser.add_argument("--output", default=None, help="write the results to this file instead of stdout")
+    # the input file may follow the options, as in './cli.py cash --regtest wallet.dump'
+    options = parser.parse_intermixed_args(argv)
+
+    path = None if options.input == "-" else options.input
+    regtest = 1 if options.regtest else 0
+    if options.output:
+        with open(options.output, "w") as out:
+            failed = run(path, sys.stdin, out, options.mode, regtest, options.column, options.jobs)
+    else:
+        failed = run(path, sys.stdin, sys.stdout, options.mode, regtest, options.column, options.jobs)
+    if failed:
+        print("%d addresses could not be converted" % failed, file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
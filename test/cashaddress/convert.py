@@ -8,22 +8,6 @@
     See Reference:
     https://github.com/oskyk/cashaddress
 
-    Dependencies:
-    - base58
-
-    Installations: 
-
-    For python3, the steps required are:
-    1. download package "base58-0.2.5-py3-none-any.whl" from https://pypi.python.org/pypi/base58
-
-    2. If Python pip package manager is not available in your environment, install it with 
-
-        > sudo apt install python3-pip
-
-    3. Install the base58 built-package by
-
-        > pip3 install base58-0.2.5-py3-none-any.whl
-
     Usages:
 
     from cashaddress import convert
@@ -44,21 +28,29 @@
     legacy_p2pkh = convert.to_legacy_address('155fzsEBHy9Ri2bMQ8uuuR3tv1YzcDywd4')
     cash_p2sh = convert.to_cash_address('3CWFddi6m4ndiGyKqzYvsFYagqDLPVMTzC')
 
+    # Example 4: converting a whole pool of addresses at once
+    legacy_pool = convert.to_legacy_addresses(cash_pool, regtest)
+
+    # Example 5: hash160 to put in a P2PKH or P2SH output script
+    pubkey_hash = convert.to_hash160('bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat', regtest)
+
     References:
     1. List of address prefixes - https://en.bitcoin.it/wiki/List_of_address_prefixes
     2. Base58Check encoding - https://en.bitcoin.it/wiki/Base58Check_encoding
 """
-from base58 import b58decode_check, b58encode_check
 import sys
 import os
 sourcePath = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(sourcePath)
 from crypto import *
+from base58check import b58decode_check, b58encode_check, check_payload
 
 class InvalidAddress(Exception):
     pass
 
 class Address:
+    __slots__ = ('code', 'payload', 'prefix')
+
     VERSION_MAP = {
         'legacy': [
             ('P2SH', 5, False),
@@ -85,60 +77,54 @@ class Address:
             ('P2PKH-REGTEST', 0, True)
         ]
     }
+    # an address keeps the index of its version in this tuple as a small int code
+    VERSIONS = ('P2SH', 'P2PKH', 'P2SH-TESTNET', 'P2PKH-TESTNET', 'P2SH-REGTEST', 'P2PKH-REGTEST')
+    VERSION_CODES = {name: code for code, name in enumerate(VERSIONS)}
     MAINNET_PREFIX = 'bitcoincash'
     TESTNET_PREFIX = 'bchtest'
     REGTEST_PREFIX = "bchreg"
+    PREFIXES = (MAINNET_PREFIX, MAINNET_PREFIX, TESTNET_PREFIX, TESTNET_PREFIX, REGTEST_PREFIX, REGTEST_PREFIX)
 
     def __init__(self, version, payload, prefix=None):
-        self.version = version
-        self.payload = payload
-        #print(">> version, payload, prefix = ", version, payload, prefix)
+        """
+        Input:
+            version : version name (eg. 'P2PKH-REGTEST') or its code in VERSIONS
+            payload : hash160 of the address, any bytes-like object
+            prefix : cashaddr prefix, derived from the version when omitted
+        """
+        if isinstance(version, int):
+            self.code = version
+        else:
+            try:
+                self.code = Address.VERSION_CODES[version]
+            except KeyError:
+                raise InvalidAddress('Could not determine address version')
+        self.payload = bytes(payload)
         if prefix:
             self.prefix = prefix
         else:
-            addr_type = 'cash'
-            if "REGTEST" in self.version:
-                addr_type = 'cash_regtest'
-
-            if Address._address_type(addr_type, self.version)[2]:
-                if addr_type == 'cash_regtest':
-                    self.prefix = self.REGTEST_PREFIX
-                else:
-                    self.prefix = self.TESTNET_PREFIX
-            else:
-                self.prefix = self.MAINNET_PREFIX
+            self.prefix = Address.PREFIXES[self.code]
+
+    @property
+    def version(self):
+        return Address.VERSIONS[self.code]
 
     def __str__(self):
-        return 'version: {}\npayload: {}\nprefix: {}'.format(self.version, self.payload, self.prefix)
+        return 'version: {}\npayload: {}\nprefix: {}'.format(self.version, list(self.payload), self.prefix)
 
     def legacy_address(self, regtest=0):
-        if regtest:
-            version_int = Address._address_type('legacy_regtest', self.version)[1]
-        else:
-            version_int = Address._address_type('legacy', self.version)[1]
-        return b58encode_check(Address.code_list_to_string([version_int] + self.payload))
+        version_int = Address._version_byte('legacy_regtest' if regtest else 'legacy', self.code)
+        return b58encode_check(bytes((version_int,)) + self.payload).decode('ascii')
 
     def cash_address(self, regtest=0):
-        if regtest:
-            version_int = Address._address_type('cash_regtest', self.version)[1]
-        else:
-            version_int = Address._address_type('cash', self.version)[1]
-        payload = [version_int] + self.payload
-        payload = convertbits(payload, 8, 5)
+        version_int = Address._version_byte('cash_regtest' if regtest else 'cash', self.code)
+        payload = pack_bits(bytes((version_int,)) + self.payload, 8, 5)
         checksum = calculate_checksum(self.prefix, payload)
         return self.prefix + ':' + b32encode(payload + checksum)
 
     @staticmethod
     def code_list_to_string(code_list):
-        if sys.version_info > (3, 0):
-            output = bytes()
-            for code in code_list:
-                output += bytes([code])
-        else:
-            output = ''
-            for code in code_list:
-                output += chr(code)
-        return output
+        return bytes(code_list)
 
     @staticmethod
     def _address_type(address_type, version):
@@ -147,6 +133,20 @@ class Address:
                 return mapping
         raise InvalidAddress('Could not determine address version')
 
+    @staticmethod
+    def _version_byte(address_type, code):
+        try:
+            return Address.VERSION_BYTES[address_type][code]
+        except KeyError:
+            raise InvalidAddress('Could not determine address version')
+
+    @staticmethod
+    def _version_code(address_type, version_int):
+        try:
+            return Address.VERSION_BYTE_CODES[address_type][version_int]
+        except KeyError:
+            raise InvalidAddress('Could not determine address version')
+
     @staticmethod
     def from_string(address_string, regtest=0):
         try:
@@ -161,17 +161,13 @@ class Address:
     @staticmethod
     def _legacy_string(address_string, regtest=0):
         try:
-            decoded = bytearray(b58decode_check(address_string))
+            decoded = b58decode_check(address_string)
         except ValueError:
             raise InvalidAddress('Could not decode legacy address')
-        if regtest:
-            version = Address._address_type('legacy_regtest', decoded[0])[0]
-        else:
-            version = Address._address_type('legacy', decoded[0])[0]
-        payload = list()
-        for letter in decoded[1:]:
-            payload.append(letter)
-        return Address(version, payload)
+        if not decoded:
+            raise InvalidAddress('Could not decode legacy address')
+        code = Address._version_code('legacy_regtest' if regtest else 'legacy', decoded[0])
+        return Address(code, decoded[1:])
 
     @staticmethod
     def _cash_string(address_string, regtest=0):
@@ -180,18 +176,42 @@ class Address:
         address_string = address_string.lower()
         if ':' not in address_string:
             address_string = Address.MAINNET_PREFIX + ':' + address_string
-        prefix, base32string = address_string.split(':')
+        prefix, _, base32string = address_string.partition(':')
+        if ':' in base32string:
+            raise InvalidAddress('Cash address contains more than one prefix separator')
         decoded = b32decode(base32string)
+        if -1 in decoded:
+            raise InvalidAddress('Cash address contains invalid characters')
         if not verify_checksum(prefix, decoded):
             raise InvalidAddress('Bad cash address checksum')
-        converted = convertbits(decoded, 5, 8)
-        version = Address._address_type('cash', converted[0])[0]
+        converted = base32_to_bytes(decoded[:-8])
+        if not converted:
+            raise InvalidAddress('Could not decode cash address')
+        version = Address.VERSIONS[Address._version_code('cash', converted[0])]
         if prefix == Address.TESTNET_PREFIX:
             version += '-TESTNET'
         if prefix == Address.REGTEST_PREFIX:
             version += '-REGTEST'
-        payload = converted[1:-6]
-        return Address(version, payload, prefix)
+        return Address(version, converted[1:], prefix)
+
+def build_version_tables():
+    """
+    Index VERSION_MAP by version code (for encoding) and by version byte (for
+    decoding, the first matching entry wins as in Address._address_type)
+    """
+    Address.VERSION_BYTES = {}
+    Address.VERSION_BYTE_CODES = {}
+    for address_type, mappings in Address.VERSION_MAP.items():
+        to_byte = {}
+        to_code = {}
+        for name, version_int, _ in mappings:
+            code = Address.VERSION_CODES[name]
+            to_byte.setdefault(code, version_int)
+            to_code.setdefault(version_int, code)
+        Address.VERSION_BYTES[address_type] = to_byte
+        Address.VERSION_BYTE_CODES[address_type] = to_code
+
+build_version_tables()
 
 def to_cash_address(address, regtest=0):
     return Address.from_string(address, regtest).cash_address(regtest)
@@ -199,9 +219,83 @@ def to_cash_address(address, regtest=0):
 def to_legacy_address(address, regtest=0):
     return Address.from_string(address, regtest).legacy_address(regtest)
 
-def is_valid(address):
-    try:
-        Address.from_string(address)
-        return True
-    except InvalidAddress:
+def to_hash160(address, regtest=0):
+    """raw 20 byte payload of a cash or legacy address, ready to be pushed in a script"""
+    return Address.from_string(address, regtest).payload
+
+def convert_many(addresses, regtest, converter):
+    """
+    Apply converter to every address of an iterable, in order. Address pools
+    repeat the same entries many times over, so each distinct address is only
+    decoded, checked and re-encoded once per call.
+    """
+    converted = {}
+    out = []
+    for address in addresses:
+        try:
+            out.append(converted[address])
+        except KeyError:
+            result = converter(address, regtest)
+            converted[address] = result
+            out.append(result)
+    return out
+
+def to_cash_addresses(addresses, regtest=0):
+    return convert_many(addresses, regtest, to_cash_address)
+
+def to_legacy_addresses(addresses, regtest=0):
+    return convert_many(addresses, regtest, to_legacy_address)
+
+def to_hash160s(addresses, regtest=0):
+    return convert_many(addresses, regtest, to_hash160)
+
+# only 160 bit hashes are used: 1 version byte + 20 byte hash + 4 byte checksum
+LEGACY_DECODED_LENGTH = 21
+# 34 symbols for the version byte and hash, 8 symbols of checksum
+CASH_ENCODED_LENGTH = 42
+LEGACY_VERSION_BYTES = frozenset(mapping[1] for mapping in Address.VERSION_MAP['legacy'])
+CASH_VERSION_BYTES = frozenset(mapping[1] for mapping in Address.VERSION_MAP['cash'])
+
+def is_valid_legacy(address):
+    payload = check_payload(address)
+    return payload is not None and len(payload) == LEGACY_DECODED_LENGTH and payload[0] in LEGACY_VERSION_BYTES
+
+def is_valid_cash(address):
+    lower = address.lower()
+    if lower != address and address.upper() != address:
+        return False
+    prefix, _, body = lower.partition(':')
+    if len(body) != CASH_ENCODED_LENGTH:
+        return False
+    # do not grow the cache of prefix states with whatever prefix is thrown at us
+    chk = PREFIX_STATES.get(prefix)
+    if chk is None:
+        chk = polymod_step(1, prefix_expand(prefix))
+    table = POLYMOD_TABLE
+    values = CHARSET_MAP
+    for letter in body:
+        value = values.get(letter)
+        if value is None:
+            return False
+        chk = table[chk >> 35] ^ (((chk & 0x07ffffffff) << 5) ^ value)
+    if chk != 1:
         return False
+    return ((values[body[0]] << 3) | (values[body[1]] >> 2)) in CASH_VERSION_BYTES
+
+def is_valid(address):
+    """
+    Check the charset, case, length, version and checksum of a cash or legacy
+    address in a single pass. No Address is built and no exception is raised.
+    """
+    if not isinstance(address, str):
+        try:
+            address = str(address)
+        except Exception:
+            return False
+    if ':' not in address:
+        return is_valid_legacy(address)
+    return is_valid_cash(address)
+
+def are_valid(addresses):
+    """is_valid for every address of an iterable, returns a list of booleans in input order"""
+    return [is_valid(address) for address in addresses]
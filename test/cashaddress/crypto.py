@@ -9,35 +9,70 @@
 """
 
 CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+CHARSET_MAP = {letter: value for value, letter in enumerate(CHARSET)}
 
-def polymod(values):
-    chk = 1
-    generator = [
-        (0x01, 0x98f2bc8e61),
-        (0x02, 0x79b76d99e2),
-        (0x04, 0xf33e5fb3c4),
-        (0x08, 0xae2eabe2a8),
-        (0x10, 0x1e4f43e470)]
+GENERATOR = [
+    (0x01, 0x98f2bc8e61),
+    (0x02, 0x79b76d99e2),
+    (0x04, 0xf33e5fb3c4),
+    (0x08, 0xae2eabe2a8),
+    (0x10, 0x1e4f43e470)]
+
+def build_polymod_table():
+    """
+    XOR of the generator entries selected by each possible 5-bit value of the
+    top of the checksum register, so every symbol costs a single table lookup
+    """
+    table = []
+    for top in range(32):
+        mask = 0
+        for bit, gen in GENERATOR:
+            if top & bit:
+                mask ^= gen
+        table.append(mask)
+    return table
+
+POLYMOD_TABLE = build_polymod_table()
+
+def polymod_step(chk, values):
+    """feed values into a running polymod state, without the final xor"""
+    table = POLYMOD_TABLE
     for value in values:
-        top = chk >> 35
-        chk = ((chk & 0x07ffffffff) << 5) ^ value
-        for i in generator:
-            if top & i[0] != 0:
-                chk ^= i[1]
-    return chk ^ 1
+        chk = table[chk >> 35] ^ (((chk & 0x07ffffffff) << 5) ^ value)
+    return chk
+
+def polymod(values):
+    return polymod_step(1, values) ^ 1
 
 def prefix_expand(prefix):
     return [ord(x) & 0x1f for x in prefix] + [0]
 
+PREFIX_STATES = {}
+
+def prefix_state(prefix):
+    """polymod state after the expanded prefix, cached per prefix"""
+    try:
+        return PREFIX_STATES[prefix]
+    except KeyError:
+        chk = polymod_step(1, prefix_expand(prefix))
+        PREFIX_STATES[prefix] = chk
+        return chk
+
+# precompute the states of the prefixes used by mainnet, testnet and regtest
+for known in ('bitcoincash', 'bchtest', 'bchreg'):
+    prefix_state(known)
+
+CHECKSUM_PADDING = [0, 0, 0, 0, 0, 0, 0, 0]
+
 def calculate_checksum(prefix, payload):
-    poly = polymod(prefix_expand(prefix) + payload + [0, 0, 0, 0, 0, 0, 0, 0])
+    poly = polymod_step(polymod_step(prefix_state(prefix), payload), CHECKSUM_PADDING) ^ 1
     out = list()
     for i in range(8):
         out.append((poly >> 5 * (7 - i)) & 0x1f)
     return out
 
 def verify_checksum(prefix, payload):
-    return polymod(prefix_expand(prefix) + payload) == 0
+    return polymod_step(prefix_state(prefix), payload) == 1
 
 def b32decode(inputs):
     out = list()
@@ -71,3 +106,41 @@ def convertbits(data, frombits, tobits, pad=True):
     elif bits >= frombits or ((acc << (tobits - bits)) & maxv):
         return None
     return ret
+
+def pack_bits(data, frombits, tobits):
+    """
+    Regroup a whole sequence of frombits-wide values into tobits-wide values
+    in one go: the values are packed into a single integer, the tail is padded
+    with zero bits and the output groups are sliced out of it.
+    Same result as convertbits(data, frombits, tobits, pad=True).
+    """
+    bits = len(data) * frombits
+    if frombits == 8:
+        try:
+            acc = int.from_bytes(bytes(data), 'big')
+        except ValueError:
+            return None
+    else:
+        acc = 0
+        for value in data:
+            if value < 0 or (value >> frombits):
+                return None
+            acc = (acc << frombits) | value
+    pad = -bits % tobits
+    acc <<= pad
+    bits += pad
+    mask = (1 << tobits) - 1
+    return [(acc >> shift) & mask for shift in range(bits - tobits, -1, -tobits)]
+
+def base32_to_bytes(values):
+    """
+    Pack 5-bit values into bytes, dropping the incomplete trailing bits that
+    were added as padding when the bytes were encoded
+    """
+    acc = 0
+    for value in values:
+        if value < 0 or (value >> 5):
+            return None
+        acc = (acc << 5) | value
+    bits = len(values) * 5
+    return (acc >> (bits % 8)).to_bytes(bits // 8, 'big')
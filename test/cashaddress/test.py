@@ -3,7 +3,15 @@
 # Copyright (c) 2018 The Bitcoin Unlimited developers
 # Distributed under the MIT software license, see the accompanying
 # file COPYING or http://www.opensource.org/licenses/mit-license.php.
+import base58check
+import cache
+import cli
+import contextlib
 import convert
+import crypto
+import io
+import os
+import tempfile
 import unittest
 
 class TestConversion(unittest.TestCase):
@@ -79,5 +87,219 @@ class TestConversion(unittest.TestCase):
         self.assertEqual(convert.to_cash_address('bchreg:qrqmez5xq2eflsemd3davcn33jqa3er7vsu49r2qvf', 1),
                          'bchreg:qrqmez5xq2eflsemd3davcn33jqa3er7vsu49r2qvf')
 
+class TestChecksum(unittest.TestCase):
+    def reference_polymod(self, values):
+        chk = 1
+        for value in values:
+            top = chk >> 35
+            chk = ((chk & 0x07ffffffff) << 5) ^ value
+            for bit, gen in crypto.GENERATOR:
+                if top & bit:
+                    chk ^= gen
+        return chk ^ 1
+
+    def test_polymod_table(self):
+        values = crypto.prefix_expand('bchreg') + list(range(32)) * 3
+        self.assertEqual(crypto.polymod(values), self.reference_polymod(values))
+
+    def test_prefix_states(self):
+        for prefix in ('bitcoincash', 'bchtest', 'bchreg', 'unknown'):
+            payload = list(range(32))
+            checksum = crypto.calculate_checksum(prefix, payload)
+            self.assertEqual(self.reference_polymod(crypto.prefix_expand(prefix) + payload + checksum), 0)
+            self.assertTrue(crypto.verify_checksum(prefix, payload + checksum))
+            self.assertFalse(crypto.verify_checksum(prefix, payload + checksum[:-1] + [checksum[-1] ^ 1]))
+
+class TestBatchConversion(unittest.TestCase):
+    def test_to_legacy_addresses(self):
+        pool = ['bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat',
+                'msZxBtBX9v9KtrUFQvbQKgxTzfNhcPzhuK',
+                'bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat']
+        self.assertEqual(convert.to_legacy_addresses(pool, 1),
+                         ['mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp',
+                          'msZxBtBX9v9KtrUFQvbQKgxTzfNhcPzhuK',
+                          'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp'])
+
+    def test_to_cash_addresses(self):
+        pool = (x for x in ['155fzsEBHy9Ri2bMQ8uuuR3tv1YzcDywd4', '3CWFddi6m4ndiGyKqzYvsFYagqDLPVMTzC'])
+        self.assertEqual(convert.to_cash_addresses(pool),
+                         ['bitcoincash:qqkv9wr69ry2p9l53lxp635va4h86wv435995w8p2h',
+                          'bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pq'])
+        self.assertEqual(convert.to_cash_addresses([]), [])
+
+class TestCache(unittest.TestCase):
+    def test_eviction_order(self):
+        lru = cache.LRUCache(2)
+        lru.put(('a', 'regtest', 'p2pkh'), 1)
+        lru.put(('b', 'regtest', 'p2pkh'), 2)
+        self.assertEqual(lru.get(('a', 'regtest', 'p2pkh')), 1)
+        lru.put(('c', 'regtest', 'p2pkh'), 3)
+        self.assertNotIn(('b', 'regtest', 'p2pkh'), lru)
+        self.assertIn(('a', 'regtest', 'p2pkh'), lru)
+        self.assertEqual(len(lru), 2)
+
+    def test_counters(self):
+        lru = cache.LRUCache(8)
+        address = 'bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat'
+        for _ in range(3):
+            legacy = lru.lookup((address, 'regtest', 'legacy'), lambda: convert.to_legacy_address(address, 1))
+        self.assertEqual(legacy, 'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp')
+        self.assertEqual((lru.hits, lru.misses), (2, 1))
+        self.assertIsNone(lru.get((address, 'mainnet', 'legacy')))
+        self.assertEqual(lru.misses, 2)
+        with self.assertRaises(ValueError):
+            cache.LRUCache(0)
+
+class TestBase58(unittest.TestCase):
+    def test_encode_decode(self):
+        self.assertEqual(base58check.b58encode(b'hello world'), b'StV1DL6CwTryKyV')
+        self.assertEqual(base58check.b58decode(b'StV1DL6CwTryKyV'), b'hello world')
+        self.assertEqual(base58check.b58encode(b'\0\0\x01'), b'112')
+        self.assertEqual(base58check.b58decode('112'), b'\0\0\x01')
+        self.assertEqual(base58check.b58encode(b''), b'')
+        self.assertEqual(base58check.b58decode(b''), b'')
+
+    def test_check(self):
+        payload = base58check.b58decode_check(b'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp')
+        self.assertEqual(len(payload), 21)
+        self.assertEqual(payload[0], 111)
+        self.assertEqual(base58check.b58encode_check(payload), b'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp')
+
+    def test_invalid(self):
+        for bad in ['mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXq', 'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfX0', '1']:
+            with self.assertRaises(ValueError):
+                base58check.b58decode_check(bad)
+
+class TestAddress(unittest.TestCase):
+    def test_compact_payload(self):
+        address = convert.Address.from_string('bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat', 1)
+        self.assertEqual(address.version, 'P2PKH-REGTEST')
+        self.assertIsInstance(address.code, int)
+        self.assertIsInstance(address.payload, bytes)
+        self.assertEqual(len(address.payload), 20)
+        with self.assertRaises(AttributeError):
+            address.extra = 1
+
+    def test_construct(self):
+        payload = bytes(range(20))
+        by_name = convert.Address('P2SH-TESTNET', bytearray(payload))
+        by_code = convert.Address(by_name.code, payload)
+        self.assertEqual(by_name.prefix, convert.Address.TESTNET_PREFIX)
+        self.assertEqual(by_name.cash_address(), by_code.cash_address())
+        self.assertEqual(convert.Address.from_string(by_name.legacy_address()).payload, payload)
+        with self.assertRaises(convert.InvalidAddress):
+            convert.Address('P2WPKH', payload)
+
+class TestValidation(unittest.TestCase):
+    def test_is_valid(self):
+        for address in ['155fzsEBHy9Ri2bMQ8uuuR3tv1YzcDywd4',
+                        'bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pq',
+                        'BCHTEST:PQC3TYSPQWN95RETV5K3C5W4FDQ0CXVV95U36GFK00',
+                        'bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat']:
+            self.assertTrue(convert.is_valid(address), address)
+
+    def test_is_not_valid(self):
+        for address in ['155fzsEBHy9Ri2bMQ8uuuR3tv1YzcDywd5',
+                        '155fzsEBHy9Ri2bMQ8uuuR3tv1YzcDyw0l',
+                        'bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pp',
+                        'bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pb',
+                        'bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829',
+                        'Bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pq',
+                        'bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gs:t',
+                        '', None]:
+            self.assertFalse(convert.is_valid(address), address)
+
+    def test_are_valid(self):
+        self.assertEqual(convert.are_valid(['mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp', 'bchreg:qq', 'mxdy']),
+                         [True, False, False])
+
+    def test_invalid_character(self):
+        with self.assertRaises(convert.InvalidAddress):
+            convert.to_legacy_address('bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pb')
+
+class TestHash160(unittest.TestCase):
+    def test_to_hash160(self):
+        cash = convert.to_hash160('bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat', 1)
+        legacy = convert.to_hash160('mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp', 1)
+        self.assertEqual(cash, legacy)
+        self.assertEqual(len(cash), 20)
+        self.assertEqual(convert.to_hash160('bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pq'),
+                         convert.to_hash160('3CWFddi6m4ndiGyKqzYvsFYagqDLPVMTzC'))
+
+    def test_to_hash160s(self):
+        pool = ['bchreg:qzaumhpmnjuwq8kjcp866jmvj9zal7tpcsrcj8gsat', 'msZxBtBX9v9KtrUFQvbQKgxTzfNhcPzhuK']
+        self.assertEqual(convert.to_hash160s(pool, 1), [convert.to_hash160(x, 1) for x in pool])
+
+class TestCli(unittest.TestCase):
+    LINES = ['# regtest wallet', 'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp', '',
+             'msZxBtBX9v9KtrUFQvbQKgxTzfNhcPzhuK', 'mxdy'] * 50
+
+    def expected(self):
+        out = []
+        for line in self.LINES:
+            if not line or line.startswith('#'):
+                out.append(line)
+            elif convert.is_valid(line):
+                out.append(convert.to_cash_address(line, 1))
+            else:
+                out.append('')
+        return '\n'.join(out) + '\n'
+
+    def test_stream(self):
+        out = io.StringIO()
+        failed = cli.run(None, io.StringIO('\n'.join(self.LINES)), out, 'cash', 1, jobs=1, chunk_lines=7)
+        self.assertEqual(out.getvalue(), self.expected())
+        self.assertEqual(failed, 50)
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            f.write('\n'.join(self.LINES) + '\n')
+            f.flush()
+            for jobs in (1, 2):
+                out = io.StringIO()
+                failed = cli.run(f.name, None, out, 'cash', 1, jobs=jobs, chunk_bytes=100)
+                self.assertEqual(out.getvalue(), self.expected())
+                self.assertEqual(failed, 50)
+
+    def test_wallet_dump_column(self):
+        line = 'cVs 2018-05-10T00:00:00Z label= # addr=mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp'
+        self.assertEqual(cli.convert_lines([line], 'validate', 1, 4), ('1\n', 0))
+
+    def test_malformed_line(self):
+        lines = ['bchreg:qq:zz', 'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp']
+        self.assertRaises(convert.InvalidAddress, convert.to_cash_address, lines[0], 1)
+        for mode in ('cash', 'legacy', 'hash160', 'validate'):
+            text, failed = cli.convert_lines(lines, mode, 1, 0)
+            self.assertEqual(failed, 0 if mode == 'validate' else 1)
+            self.assertEqual(text.split('\n')[0], '0' if mode == 'validate' else '')
+
+    def main(self, argv):
+        """run the command line, return its exit code and what it wrote to stdout"""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = cli.main(argv)
+        return code, out.getvalue()
+
+    def test_documented_usages(self):
+        dump = 'cVs 2018-05-10T00:00:00Z label= # addr=mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp\n'
+        cash = convert.to_cash_address('mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp', 1)
+        with tempfile.TemporaryDirectory() as folder:
+            wallet = os.path.join(folder, 'wallet.dump')
+            with open(wallet, 'w') as f:
+                f.write(dump)
+            for argv in (['cash', '--regtest', '--column=4', wallet],
+                         ['cash', '--regtest', '--column=4', '--', wallet],
+                         ['--regtest', 'cash', wallet, '--column=4']):
+                self.assertEqual(self.main(argv), (0, cash + '\n'), argv)
+            addresses = os.path.join(folder, 'cash.txt')
+            with open(addresses, 'w') as f:
+                f.write(cash + '\nbchreg:qq:zz\n')
+            output = os.path.join(folder, 'legacy.txt')
+            with contextlib.redirect_stderr(io.StringIO()):
+                code, printed = self.main(['legacy', '--jobs=2', '--output=' + output, '--regtest', addresses])
+            self.assertEqual((code, printed), (1, ''))
+            with open(output) as f:
+                self.assertEqual(f.read(), 'mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp\n\n')
+
 if __name__ == '__main__':
     unittest.main()
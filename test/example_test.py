@@ -64,13 +64,13 @@ class MyTest(BitcoinTestFramework):
 
     @assert_capture()
     def test1(self):
-        logging.info("block count: %s" % ([ x.getblockcount() for x in self.nodes]))
+        logging.info("block count: %s" % (NodeGroup(self.nodes).getblockcount()))
         # logging.info("peers: %s" % ([ x.getpeerinfo() for x in self.nodes]))
         for n in self.nodes[0:3]:
             n.generate(10)
         time.sleep(5)
-        logging.info("block count: %s" % ([ x.getblockcount() for x in self.nodes]))
-        logging.info("Connection count: %s" % ([ x.getconnectioncount() for x in self.nodes]))
+        logging.info("block count: %s" % (NodeGroup(self.nodes).getblockcount()))
+        logging.info("Connection count: %s" % (NodeGroup(self.nodes).getconnectioncount()))
 
         # verify main chain tip branchlen and status
         verify_chain_tip(self, 0)
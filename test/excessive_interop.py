@@ -22,6 +22,10 @@ from test_framework.util import *
 from test_framework.mininode import *
 from test_framework.script import CScript, OP_TRUE, OP_CHECKSIG, OP_DROP, OP_DUP, OP_HASH160, OP_EQUALVERIFY, OP_CHECKSIG
 from interopUtils import *
+from interopSigner import nodeSigner, signedInputSize
+from interopSync import SyncWaiter, zmqArgs
+from interopRpc import proxyBatch, replyResult
+from interopUtxo import nodeUtxoPool, fanOutUtxos
 
 NODE_BITCOIN_CASH = (1 << 5)
 ONE_MB = 1000000
@@ -30,7 +34,15 @@ FIVE_MB = 5000000
 
 SCRIPT_WORDS = b"this is junk data. this is junk data. this is junk data. this is junk data. this is junk data."
 ITERATIONS = 4   # number of iterations to create 12500 bytes of useless script words
+# transactions sent to the node in a single JSON-RPC batch request
+TX_SUBMIT_BATCH = 100
 
+# junk data push and opcodes of wastefulOutput, the junk is only built once
+WASTEFUL_TEMPLATE = ScriptTemplate([SCRIPT_WORDS * ITERATIONS, OP_DROP,
+                                    OP_DUP, OP_HASH160, HASH160_HOLE, OP_EQUALVERIFY, OP_CHECKSIG])
+P2PKH_TEMPLATE = ScriptTemplate([OP_DUP, OP_HASH160, HASH160_HOLE, OP_EQUALVERIFY, OP_CHECKSIG])
+
+@cachedScript("wasteful")
 def wastefulOutput(btcAddress):
     """ 
     Create useless data for CScript to generate many transactions used for Large Block size of 1MB to 32MB
@@ -41,17 +53,12 @@ def wastefulOutput(btcAddress):
     Warning: 
         Creates outputs that can't be spent by bitcoind
     """
-    data = b""
-    # Concatenate len(SCRIPT_WORDS) for 100 times to get data of 12500 bytes
-    for _ in range(ITERATIONS):
-        data += SCRIPT_WORDS
-    ret = CScript([data, OP_DROP, OP_DUP, OP_HASH160, bitcoinAddress2bin(btcAddress), OP_EQUALVERIFY, OP_CHECKSIG])
-    return ret
+    return WASTEFUL_TEMPLATE(bitcoinAddress2bin(btcAddress))
 
+@cachedScript("p2pkh")
 def p2pkh(btcAddress):
     """ create a pay-to-public-key-hash script"""
-    ret = CScript([OP_DUP, OP_HASH160, bitcoinAddress2bin(btcAddress), OP_EQUALVERIFY, OP_CHECKSIG])
-    return ret
+    return P2PKH_TEMPLATE(bitcoinAddress2bin(btcAddress))
 
 def createrawtransaction(inputs, outputs, outScriptGenerator=p2pkh):
     """
@@ -73,59 +80,45 @@ def createrawtransaction(inputs, outputs, outScriptGenerator=p2pkh):
     tx.rehash()
     return hexlify(tx.serialize()).decode("utf-8")
 
-def generateTx(node, txBytes, addrs, data=None):
-    wallet = node.listunspent()
-    wallet.sort(key=lambda x: x["amount"], reverse=False)
+def generateTx(node, txBytes, addrs, data=None, batchSize=TX_SUBMIT_BATCH):
+    wallet = nodeUtxoPool(node)
+    wallet.sync()
     logging.info("Wallet length is %d" % len(wallet))
 
     size = 0
     count = 0
+    signer = nodeSigner(node)
     decContext = decimal.getcontext().prec
     decimal.getcontext().prec = 8 + 8  # 8 digits to get to 21million, and each bitcoin is 100 million satoshis
     while size < txBytes:
-        count += 1
-        utxo = wallet.pop()
-        outp = {}
-        # Make the tx bigger by adding addtl outputs so it validates faster
-        payment = satoshi_round(utxo["amount"] / decimal.Decimal(8.0))
-        for x in range(0, 8):
-            outp[addrs[(count + x) % len(addrs)]] = payment
-        if data:
-            outp["data"] = data
-        txn = createrawtransaction([utxo], outp, wastefulOutput)
-        # txn2 = node.createrawtransaction([utxo], outp)
-        signedtxn = node.signrawtransaction(txn)
-        size += len(binascii.unhexlify(signedtxn["hex"]))
-        node.sendrawtransaction(signedtxn["hex"])
+        # build transactions up to the expected size, then sign them all at once
+        txns = []
+        expected = size
+        while expected < txBytes:
+            count += 1
+            utxo = wallet.pop()
+            outp = {}
+            # Make the tx bigger by adding addtl outputs so it validates faster
+            payment = satoshi_round(utxo["amount"] / decimal.Decimal(8.0))
+            for x in range(0, 8):
+                outp[addrs[(count + x) % len(addrs)]] = payment
+            if data:
+                outp["data"] = data
+            txn = createrawtransaction([utxo], outp, wastefulOutput)
+            expected += len(txn) // 2 + signedInputSize(utxo["scriptPubKey"])
+            txns.append((txn, [utxo]))
+        signed = signer.sign(txns)
+        for start in range(0, len(signed), batchSize):
+            batch = proxyBatch(node)
+            for txn_hex, txn_id in signed[start:start + batchSize]:
+                size += len(txn_hex) // 2
+                batch.add("sendrawtransaction", txn_hex)
+            for reply in batch.execute():
+                replyResult(reply)
     logging.info("%d tx %d length" % (count, size))
     decimal.getcontext().prec = decContext
     return (count, size)
 
-def mostly_sync_mempools(rpc_connections, difference=50, wait=1, verbose=1):
-    """
-    Wait until everybody has the most of the same transactions in their memory
-    pools. There is no guarantee that mempools will ever sync due to the
-    filterInventoryKnown bloom filter.
-    """
-    iterations = 0
-    while True:
-        iterations += 1
-        pool = set(rpc_connections[0].getrawmempool())
-        num_match = 1
-        poolLen = [len(pool)]
-        for i in range(1, len(rpc_connections)):
-            tmp = set(rpc_connections[i].getrawmempool())
-            if tmp == pool:
-                num_match = num_match + 1
-            if iterations > 10 and len(tmp.symmetric_difference(pool)) < difference:
-                num_match = num_match + 1
-            poolLen.append(len(tmp))
-        if verbose:
-            logging.info("sync mempool: " + str(poolLen))
-        if num_match == len(rpc_connections):
-            break
-        time.sleep(wait)
-
 def print_bestblockhash(node, nodeId):
     """ 
     Helper to print bestblockhash and block size
@@ -235,16 +228,16 @@ def test_sync_clear_mempool(self):
     logging.info(">>> Entered : test_sync_clear_mempool \n")
     try:
         # clear out the mempool
-        mostly_sync_mempools(self.nodes)
+        self.waiter.mostlySyncMempools()
         for index1, n in enumerate(self.nodes):
             n.generate(2)
-            sync_blocks(self.nodes)
+            self.waiter.syncBlocks()
         for index2, n in enumerate(self.nodes):
             while len(n.getrawmempool()):
                 n.generate(1)
-                sync_blocks(self.nodes)
-        logging.info("cleared mempool: %s" % str([len(x) for x in [y.getrawmempool() for y in self.nodes]]))
-        base = [x.getrawmempool() for x in self.nodes]
+                self.waiter.syncBlocks()
+        logging.info("cleared mempool: %s" % str([len(x) for x in NodeGroup(self.nodes).getrawmempool()]))
+        base = NodeGroup(self.nodes).getrawmempool()
         assert_equal(base, [base[0]] * 4)
     except (Exception, JSONRPCException) as e1:
         logging.info(e1)
@@ -275,25 +268,27 @@ def test_accept_depth(self, nodeOneId, nodeTwoId):
         addr = self.nodes[nodeTwoId].getnewaddress()
         for i in range(0,10):
           self.nodes[nodeOneId].sendtoaddress(addr, 1.0)
+        before = self.nodes[nodeTwoId].getblockcount()
         self.nodes[nodeOneId].generate(1)
-        time.sleep(2) #give blocks a chance to fully propagate
-        counts = [ x.getblockcount() for x in self.nodes[0:2] ]
+        assert_never(lambda: self.nodes[nodeTwoId].getblockcount() != before, what="excessive block accepted")
+        counts = NodeGroup(self.nodes[0:2]).getblockcount()
 
         logging.info("Counts: Node1 = %d and Node2 = %d " %(counts[0], counts[1]))
         assert_equal(counts[0]-counts[1], 1)
         # Mine a block on top. Node 1 should still not accept it
         self.nodes[nodeOneId].generate(1)
-        time.sleep(2) #give blocks a chance to fully propagate
-        counts = [ x.getblockcount() for x in self.nodes[0:2] ]
+        assert_never(lambda: self.nodes[nodeTwoId].getblockcount() != before, what="chain above excessive block accepted")
+        counts = NodeGroup(self.nodes[0:2]).getblockcount()
         logging.info("Counts: Node1 = %d and Node2 = %d " %(counts[0], counts[1]))
         assert_equal(counts[0]-counts[1], 2)
 
         # Change node 1 to AD=2. The assertion will fail if it doesn't accept the chain now 
         self.nodes[nodeTwoId].setexcessiveblock(1010, 2)
         self.nodes[nodeOneId].generate(1)
-        time.sleep(2) #give blocks a chance to fully propagate  !!!!
+        waitUntil(lambda: self.nodes[nodeTwoId].getblockcount() == self.nodes[nodeOneId].getblockcount(), 30,
+                  what="chain accepted at accept depth 2")
 
-        counts = [ x.getblockcount() for x in self.nodes[0:2] ]
+        counts = NodeGroup(self.nodes[0:2]).getblockcount()
         logging.info("Counts: Node1 = %d and Node2 = %d " %(counts[0], counts[1]))
         assert_equal(counts[0]-counts[1], 0)
     except (Exception, JSONRPCException) as e1:
@@ -347,7 +342,7 @@ def testExcessiveSigops(self):
 
     for n in self.nodes:
         n.generate(10)
-        self.sync_blocks()
+        self.waiter.syncBlocks()
 
     self.nodes[0].generate(100)  # create a lot of BTC for spending
     self.sync_all()
@@ -378,14 +373,12 @@ def testExcessiveSigops(self):
     if self.extended:  # creating 1MB+ blocks is too slow for travis due to the signing cost
         self.createUtxos(self.nodes[0], addrs, 10000)  # we need a lot to generate 1MB+ blocks
 
-        wallet = self.nodes[0].listunspent()
-        wallet.sort(key=lambda x: x["amount"], reverse=True)
         self.nodes[0].set("net.excessiveSigopsPerMb=100000")  # Set this huge so all txns are accepted by this node
 
         logging.info("Generate > 1MB block with excessive sigops")
         generateTx(self.nodes[0], 1100000, addrs)
 
-        counts = [x.getblockcount() for x in self.nodes]
+        counts = NodeGroup(self.nodes).getblockcount()
         base = counts[0]
 
         self.nodes[0].generate(1)
@@ -407,7 +400,7 @@ def testExcessiveSigops(self):
     # set it all back to defaults
     for n in self.nodes:
         n.generate(150)
-        self.sync_blocks()
+        self.waiter.syncBlocks()
 
     self.nodes[0].set("net.excessiveSigopsPerMb=20000")  # Set low so txns will fail if its used
     self.nodes[1].set("net.excessiveSigopsPerMb=20000")
@@ -433,7 +426,9 @@ class TestInterOpExcessive(BitcoinTestFramework):
         logging.info(self.bins)
 
     def setup_network(self, split=False):
-        self.nodes = start_nodes(len(self.clientDirs), self.options.tmpdir,binary=self.bins, timewait=60*60)
+        notify = zmqArgs(self.bins)
+        self.nodes = start_nodes(len(self.clientDirs), self.options.tmpdir, notify, binary=self.bins, timewait=60*60)
+        self.waiter = SyncWaiter(self.nodes, notify)
 
         # Connect each node to the other
         connect_nodes_bi(self.nodes,0,1)
@@ -460,30 +455,21 @@ class TestInterOpExcessive(BitcoinTestFramework):
 
         # Fixed-6: Insufficient funds
         self.nodes[0].generate(101)
-        sync_blocks(self.nodes)
+        self.waiter.syncBlocks()
         test_accept_depth(self, nodeOneId=0, nodeTwoId=1)
 
         test_excessive_Sigops(self)
 
         reporter.display_report()
 
-    def createUtxos(self, node, addrs, amt):
-        wallet = node.listunspent()
-        wallet.sort(key=lambda x: x["amount"], reverse=True)
+    def sync_all(self):
+        self.waiter.syncBlocks()
+        self.waiter.syncMempools()
 
+    def createUtxos(self, node, addrs, amt):
         # Create a LOT of UTXOs
         logging.info("Create lots of UTXOs...")
-        n = 0
-        group = min(100, amt)
-        count = 0
-        for w in wallet:
-            count += group
-            split_transaction(node, [w], addrs[n:group + n])
-            n += group
-            if n >= len(addrs):
-                n = 0
-            if count > amt:
-                break
+        fanOutUtxos(node, addrs, amt)
         self.sync_all()
         logging.info("mine blocks")
         node.generate(1)  # mine all the created transactions
@@ -491,17 +477,7 @@ class TestInterOpExcessive(BitcoinTestFramework):
         self.sync_all()
 
     def expectHeights(self, blockHeights, waittime=10):
-        loop = 0
-        count = []
-        while loop < waittime:
-            counts = [x.getblockcount() for x in self.nodes]
-            if counts == blockHeights:
-                return True  # success!
-            time.sleep(1)
-            loop += 1
-            if ((loop % 30) == 0):
-                logging.info("...waiting %s" % loop)
-        return False
+        return self.waiter.waitHeights(blockHeights, waittime)
 
     def generateAndPrintBlock(self, node):
         hsh = node.generate(1)
@@ -19,6 +19,7 @@ from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import *
 from test_framework.blocktools import *
 from interopUtils import *
+from interopUtxo import nodeUtxoPool
 from test_framework.key import CECKey
 from test_framework.script import *
 import interopNodes
@@ -57,6 +58,8 @@ class ForkMay2018(BitcoinTestFramework):
         self.forkTime = int(time.time())
         self.conf = { "forkMay2018time": self.forkTime, "acceptnonstdtxn": 0, "relaypriority": 0 }
         self.conf.update(bitcoinConfDict)
+        # verify our address conversion against the clients' getaddressforms
+        self.crossCheckAddrs = False
         logging.info(self.bins)
 
 # Comment out setup_chain() to use FW setup, which will build up cache if it does not exist. 
@@ -125,7 +128,7 @@ class ForkMay2018(BitcoinTestFramework):
         """
         if (name in n.clientName):
             # validate txns in mempool from other clients
-            mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+            mp = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
             print("memory pools are %s" % str(mp))
             txn_count = count-1
             assert mp == [txn_count, txn_count, txn_count, txn_count], "transaction was not relayed to all nodes %s" % str(mp)
@@ -138,15 +141,15 @@ class ForkMay2018(BitcoinTestFramework):
             self.sync_blocks()
 
             # after mined block and mempool should be cleared
-            mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+            mp = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
             print("memory pools are %s" % str(mp))
             assert mp == [0, 0, 0, 0], "transaction was not relayed to all nodes %s" % str(mp)
 
     def generateTx(self, node, addrs, data=None, script=p2pkh):
         FEE = decimal.Decimal("0.0001")
-        wallet = node.listunspent()
+        wallet = nodeUtxoPool(node)
+        wallet.sync()
         #print("\n wallet = ", wallet[0])
-        wallet.sort(key=lambda x: x["amount"], reverse=False)
         size = 0
         count = 0
         decContext = decimal.getcontext().prec
@@ -166,52 +169,53 @@ class ForkMay2018(BitcoinTestFramework):
         #node.sendrawtransaction(signedtxn["hex"])
         try:
             node.sendrawtransaction(signedtxn["hex"])
-        except Exception as e:
+        except JSONRPCException as e:
+            # only a refusal by the node, a transport error may have left the coin spent
             print(e)
+            wallet.quarantine(utxo, str(e))  # the coin was not spent, do not try it again
             assert 0, "%s: sendrawtransaction failed" % node.clientName
         decimal.getcontext().prec = decContext
         return signedtxn
 
     @assert_capture()
     def TestHub(self):
-        cnxns = [ x.getconnectioncount() for x in self.nodes]
+        cnxns = NodeGroup(self.nodes).getconnectioncount()
         # failed without enable wallet as getnewaddress is in rpcwallet.cpp
-        addrsbch = [ x.getnewaddress() for x in self.nodes]
-        addrs = [ self.nodes[0].getaddressforms(x)["legacy"] for x in addrsbch]  # TODO handle bitcoincash addrs in python
+        addrsbch = NodeGroup(self.nodes).getnewaddress()
+        addrs = legacyAddresses(self.nodes, addrsbch, self.crossCheckAddrs)
         #print(addrs)
         count=1
         for n in self.nodes:
             self.verifyExistingTxnMempool(n, addrsbch, "hub", count)
             tx = self.generateTx(n, addrs)
             mp = [0]*4
-            tries = 10
-            while mp != [count]*4 and tries > 0:
-                tries -= 1
-                time.sleep(2) # wait for tx to sync
+            def synced():
                 try:
-                    mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+                    mp[:] = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
                 except Exception as e:
                     #print(e)
                     pass
+                return mp == [count]*4
+            waitUntil(synced, 20, what="tx to sync")
             print("memory pools are %s" % str(mp))
-            assert [ x.getconnectioncount() for x in self.nodes] == cnxns # make sure nobody dropped or banned
+            assert NodeGroup(self.nodes).getconnectioncount() == cnxns # make sure nobody dropped or banned
             count += 1
         #only one txn of client Hub left in the mempool
-        mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+        mp = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
         print("memory pools are %s" % str(mp))
         assert mp == [1, 1, 1, 1], "transaction was not relayed to all nodes %s" % str(mp)
         node = self.nodes[0]
         node.generate(2)
         sync_blocks(self.nodes)
-        mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+        mp = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
         print("memory pools are %s" % str(mp))
         assert mp == [0,0,0,0], "transaction was not relayed to all nodes %s" % str(mp)
 
     @assert_capture()
     def testOpP2SH(self):
-        cnxns = [ x.getconnectioncount() for x in self.nodes]
-        addrsbch = [ x.getnewaddress() for x in self.nodes]
-        addrs = [ self.nodes[0].getaddressforms(x)["legacy"] for x in addrsbch]  # TODO handle bitcoincash addrs in python
+        cnxns = NodeGroup(self.nodes).getconnectioncount()
+        addrsbch = NodeGroup(self.nodes).getnewaddress()
+        addrs = legacyAddresses(self.nodes, addrsbch, self.crossCheckAddrs)
         count=1
         #clean up mempool before testing
         self.emptyMemPool()
@@ -219,19 +223,18 @@ class ForkMay2018(BitcoinTestFramework):
         for n in self.nodes:
             tx = self.generateTx(n, addrs, hexlify(("*"*2).encode("utf-8")), p2sh)  #p2sh
             mp = [0]*4
-            tries = 10
-            while mp != [count]*4 and tries > 0:
-                tries -= 1
-                time.sleep(1) # wait for tx to sync
-                mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+            def synced():
+                mp[:] = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
+                return mp == [count]*4
+            waitUntil(synced, 10, what="tx to sync")
             print("memory pools are %s" % str(mp))
             assert mp == [count]*4, "transaction was not relayed to all nodes %s" % str(mp)
-            assert [ x.getconnectioncount() for x in self.nodes] == cnxns # make sure nobody dropped or banned
+            assert NodeGroup(self.nodes).getconnectioncount() == cnxns # make sure nobody dropped or banned
             count += 1
         # mine a block and verify that all nodes accept it
         self.nodes[0].generate(1)
         sync_blocks(self.nodes)
-        logging.info("mempool counts: %s" % [ x.getmempoolinfo()["size"] for x in self.nodes])
+        logging.info("mempool counts: %s" % [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()])
 
 def Test():
     bitcoinConf = {
@@ -240,6 +243,7 @@ def Test():
     }
     t = ForkMay2018("debug", clientDirs, bitcoinConf)
     t.drop_to_pdb = True
+    t.crossCheckAddrs = "--crosscheck-addresses" in sys.argv
     # folder to store bitcoin runtime data and logs
     tmpdir = "--tmpdir=/ramdisk/cashInterop"
 
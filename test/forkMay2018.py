@@ -19,8 +19,13 @@ from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import *
 from test_framework.blocktools import *
 from interopUtils import *
+from interopUtxo import nodeUtxoPool
 import interopNodes
 
+# seconds a refused transaction is given to show up in a mempool anyway, a
+# debug build of a client can take longer than PROPAGATION_HOLD to relay it
+REFUSED_TX_HOLD = 5
+
 def verify_chain_tip(self, nodeId):
     """
     Verify the main chain of all know tips in the block tree
@@ -45,6 +50,8 @@ class ForkMay2018(BitcoinTestFramework):
         self.forkTime = int(time.time())
         self.conf = { "forkMay2018time": self.forkTime, "acceptnonstdtxn": 0, "relaypriority": 0 }
         self.conf.update(bitcoinConfDict)
+        # verify our address conversion against the clients' getaddressforms
+        self.crossCheckAddrs = False
         logging.info(self.bins)
 
     def setup_network(self, split=False):
@@ -81,8 +88,8 @@ class ForkMay2018(BitcoinTestFramework):
 
     def generateTx(self, node, addrs, data=None):
         FEE = decimal.Decimal("0.0001")
-        wallet = node.listunspent()
-        wallet.sort(key=lambda x: x["amount"], reverse=False)
+        wallet = nodeUtxoPool(node)
+        wallet.sync()
 
         size = 0
         count = 0
@@ -103,45 +110,50 @@ class ForkMay2018(BitcoinTestFramework):
             #txn = createrawtransaction([utxo], outp, createWastefulOutput)
             signedtxn = node.signrawtransaction(txn)
             size += len(binascii.unhexlify(signedtxn["hex"]))
-            node.sendrawtransaction(signedtxn["hex"])
+            try:
+                node.sendrawtransaction(signedtxn["hex"])
+            except JSONRPCException as e:
+                wallet.quarantine(utxo, str(e))  # the coin was not spent, do not try it again
+                raise
         decimal.getcontext().prec = decContext
         return signedtxn
 
     @assert_capture()
     def preTestOpReturn(self):
-        cnxns = [ x.getconnectioncount() for x in self.nodes]
-        addrsbch = [ x.getnewaddress() for x in self.nodes]
-        addrs = [ self.nodes[0].getaddressforms(x)["legacy"] for x in addrsbch]  # TODO handle bitcoincash addrs in python
+        cnxns = NodeGroup(self.nodes).getconnectioncount()
+        addrsbch = NodeGroup(self.nodes).getnewaddress()
+        addrs = legacyAddresses(self.nodes, addrsbch, self.crossCheckAddrs)
         for n in self.nodes:
             try:
                 tx = self.generateTx(n, addrs, hexlify(("*"*200).encode("utf-8")))
                 assert 0, "%s: 200 byte OP_RETURN accepted before the fork" % n.clientName
             except JSONRPCException as e:
                 pass
-        time.sleep(5) # wait for tx to sync
-        mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+        # no refused tx may show up in a mempool
+        assert_never(lambda: any(info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()),
+                     duration=REFUSED_TX_HOLD, what="refused tx relayed")
+        mp = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
         print("memory pools are %s" % str(mp))
         assert mp == [0,0,0,0]
-        assert [ x.getconnectioncount() for x in self.nodes] == cnxns # make sure nobody dropped or banned
+        assert NodeGroup(self.nodes).getconnectioncount() == cnxns # make sure nobody dropped or banned
 
     @assert_capture()
     def testOpReturn(self):
-        cnxns = [ x.getconnectioncount() for x in self.nodes]
-        addrsbch = [ x.getnewaddress() for x in self.nodes]
-        addrs = [ self.nodes[0].getaddressforms(x)["legacy"] for x in addrsbch]  # TODO handle bitcoincash addrs in python
+        cnxns = NodeGroup(self.nodes).getconnectioncount()
+        addrsbch = NodeGroup(self.nodes).getnewaddress()
+        addrs = legacyAddresses(self.nodes, addrsbch, self.crossCheckAddrs)
         count=1
         for n in self.nodes:
             # tx = self.generateTx(n, addrs, hexlify(("*"*2).encode("utf-8")))
             tx = self.generateTx(n, addrs)
             mp = [0]*4
-            tries = 10
-            while mp != [count]*4 and tries > 0:
-                tries -= 1
-                time.sleep(1) # wait for tx to sync
-                mp = [ x.getmempoolinfo()["size"] for x in self.nodes]
+            def synced():
+                mp[:] = [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()]
+                return mp == [count]*4
+            waitUntil(synced, 10, what="tx to sync")
             print("memory pools are %s" % str(mp))
             assert mp == [count]*4, "transaction was not relayed to all nodes %s" % str(mp)
-            assert [ x.getconnectioncount() for x in self.nodes] == cnxns # make sure nobody dropped or banned
+            assert NodeGroup(self.nodes).getconnectioncount() == cnxns # make sure nobody dropped or banned
             count += 1
 
 
@@ -152,6 +164,7 @@ def Test():
     }
     t = ForkMay2018("debug", clientDirs, bitcoinConf)
     t.drop_to_pdb = True
+    t.crossCheckAddrs = "--crosscheck-addresses" in sys.argv
     # folder to store bitcoin runtime data and logs
     tmpdir = "--tmpdir=/ramdisk/cashInterop"
 
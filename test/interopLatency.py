@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Measure how long the blocks and transactions made on one client take to
+    reach each of the other clients.
+
+    The arrival times come from the SyncWaiter: ZMQ notifications, or high
+    frequency polling of the clients built without ZMQ. The origin of a block
+    or transaction is the node whose generate, sendrawtransaction or
+    sendtoaddress made it, or else the node that announced it first. Its
+    origin time is when that node announced it.
+
+    Every latency belongs to the workload marked last before its origin time.
+    The report is a latency matrix (origin client -> receiving client) with
+    percentiles for each workload and for blocks and transactions apart.
+
+    Usages:
+
+    recorder = PropagationRecorder(self.waiter, self.clientDirs)
+    recorder.mark("SIZE_1_MB")
+    ...
+    recorder.report()  # logs the matrix and returns it
+    recorder.save("latency.json")
+"""
+import json
+import logging
+import math
+import time
+
+# percentiles of the latencies given by the report
+LATENCY_PERCENTILES = (50, 90, 99)
+
+def percentile(values, p):
+    """nearest rank percentile p of a list of numbers"""
+    ordered = sorted(values)
+    rank = max(int(math.ceil(p / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+class PropagationRecorder(object):
+    def __init__(self, waiter, names):
+        """
+        Input:
+            waiter : SyncWaiter of the running nodes
+            names : client name of every node (eg. clientDirs)
+        """
+        self.waiter = waiter
+        # the same client can run on several nodes
+        self.names = ["%d:%s" % (n, name) for n, name in enumerate(names)]
+        # hash hex -> (node index, time the RPC returned)
+        self.made = {}
+        # (time, workload) in time order
+        self.marks = [(0, "setup")]
+        for n, node in enumerate(waiter.nodes):
+            self.instrument(node, n)
+        waiter.startPolling()
+
+    def instrument(self, node, n):
+        """note the blocks and transactions the node makes through its RPCs"""
+        def wrap(method, hashes):
+            call = getattr(node, method)
+            def wrapped(*args):
+                result = call(*args)
+                now = time.time()
+                for h in hashes(result):
+                    self.made[h] = (n, now)
+                return result
+            setattr(node, method, wrapped)
+        wrap("generate", lambda result: result)
+        wrap("sendrawtransaction", lambda result: [result])
+        wrap("sendtoaddress", lambda result: [result])
+
+    def mark(self, workload):
+        """the blocks and transactions made from now on belong to workload"""
+        self.marks.append((time.time(), workload))
+
+    def workloadAt(self, when):
+        workload = self.marks[0][1]
+        for start, name in self.marks:
+            if start > when:
+                break
+            workload = name
+        return workload
+
+    def samples(self):
+        """{(workload, kind): {(origin client, receiving client): [seconds...]}}"""
+        result = {}
+        for h, (kind, arrivals) in self.waiter.announced().items():
+            if h in self.made:
+                origin, returned = self.made[h]
+                start = arrivals.get(origin, returned)
+            else:
+                origin = min(arrivals, key=arrivals.get)
+                start = arrivals[origin]
+            matrix = result.setdefault((self.workloadAt(start), kind), {})
+            for n, when in arrivals.items():
+                if n != origin:
+                    # announced by the origin after a polled node saw it
+                    matrix.setdefault((self.names[origin], self.names[n]), []).append(max(when - start, 0))
+        return result
+
+    def report(self, percentiles=LATENCY_PERCENTILES):
+        """
+        Log the latency matrix
+        Return:
+            list of {"workload", "kind", "origin", "receiver", "count", "p50"... "max"} in milliseconds
+        """
+        rows = []
+        for (workload, kind), matrix in sorted(self.samples().items(), key=lambda x: (x[0][0], str(x[0][1]))):
+            logging.info("propagation of %s %ss (ms)" % (workload, kind))
+            for (origin, receiver), latencies in sorted(matrix.items()):
+                row = {"workload": workload, "kind": kind, "origin": origin, "receiver": receiver,
+                       "count": len(latencies), "max": max(latencies) * 1000}
+                for p in percentiles:
+                    row["p%d" % p] = percentile(latencies, p) * 1000
+                rows.append(row)
+                logging.info("  %-10s -> %-10s %6d  %s  max %.1f" % (origin, receiver, len(latencies),
+                             "  ".join("p%d %.1f" % (p, row["p%d" % p]) for p in percentiles), row["max"]))
+        return rows
+
+    def save(self, path):
+        """write the report rows to a JSON file"""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Plan the transactions that fill a block up to a byte target before
+    anything is built or signed.
+
+    Every planned transaction spends one P2PKH input and pays a number of
+    outputs whose script holds a junk data push of a given padding length.
+    All transactions are full (most outputs, longest padding) except the last
+    ones, whose output count and padding are chosen so that the signed
+    transactions add up to the target within the tolerance.
+
+    Usages:
+
+    plan = planTransactions(SIZE_28_MB, WASTEFUL_OUTPUTS, WASTEFUL_PADDING, wastefulScriptSize)
+    for outputs, padding in plan:
+        ...
+"""
+from interopSigner import SIGNED_INPUT_SIZE
+
+# bytes of transactions above the target accepted by the planner
+PLAN_TOLERANCE = 100
+
+# a low-S DER signature is 71 bytes long when the top bit of r is set and 70
+# bytes otherwise, so a signed input is usually at most one byte shorter than
+# SIGNED_INPUT_SIZE. The plan uses the 70 byte signature, a signed transaction
+# is at most a byte per input over its planned size. When r or s starts with
+# a zero byte (about 1 signature in 128) the signature is shorter still: the
+# builders give the planned sizes to LocalSigner.sign, which signs such a
+# transaction again so that it does not fall under the plan.
+SIGNED_INPUT_MIN_SIZE = SIGNED_INPUT_SIZE - 1
+
+def varIntSize(n):
+    """size of the compact size encoding of n"""
+    if n < 0xfd:
+        return 1
+    if n <= 0xffff:
+        return 3
+    if n <= 0xffffffff:
+        return 5
+    return 9
+
+def outputSize(scriptLen):
+    """size of a serialized output: amount, script length and script"""
+    return 8 + varIntSize(scriptLen) + scriptLen
+
+def signedTxSize(outputScriptLens, inputs=1):
+    """size of a signed transaction spending P2PKH inputs, see SIGNED_INPUT_MIN_SIZE"""
+    # prevout, empty script length and sequence of every input, plus its signature
+    inputSize = 32 + 4 + 1 + 4 + SIGNED_INPUT_MIN_SIZE
+    size = 4 + varIntSize(inputs) + inputs * inputSize
+    size += varIntSize(len(outputScriptLens)) + sum(outputSize(x) for x in outputScriptLens)
+    return size + 4
+
+def closestTx(target, maxOutputs, maxPadding, txSize, tolerance):
+    """
+    (outputs, padding) of the smallest transaction of at least target bytes,
+    None when no transaction is less than tolerance bytes above the target
+    """
+    best = None
+    for outputs in range(1, maxOutputs + 1):
+        if txSize(outputs, maxPadding) < target:
+            continue
+        # sizes grow with the padding, find the shortest one reaching the target
+        low, high = 0, maxPadding
+        while low < high:
+            middle = (low + high) // 2
+            if txSize(outputs, middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        over = txSize(outputs, low) - target
+        if best is None or over < best[0]:
+            best = (over, outputs, low)
+    if best is None or best[0] > tolerance:
+        return None
+    return best[1], best[2]
+
+def planTransactions(txBytes, maxOutputs, maxPadding, scriptSize, extraScriptLens=(), tolerance=PLAN_TOLERANCE):
+    """
+    Input:
+        txBytes : total size of the signed transactions to reach
+        maxOutputs : number of padded outputs of a full transaction
+        maxPadding : padding length of the outputs of a full transaction
+        scriptSize : function giving the output script length for a padding length
+        extraScriptLens : lengths of the other output scripts of every transaction (eg. OP_RETURN data)
+        tolerance : bytes above txBytes accepted for the total
+    Return:
+        list of (outputs, padding) for each transaction, full transactions first
+    """
+    scriptLens = {}
+    def txSize(outputs, padding):
+        if padding not in scriptLens:
+            scriptLens[padding] = scriptSize(padding)
+        return signedTxSize([scriptLens[padding]] * outputs + list(extraScriptLens))
+
+    fullSize = txSize(maxOutputs, maxPadding)
+    smallest = txSize(1, 0)
+    plan = []
+    remaining = txBytes
+    # leave at least two full transactions of room so the tail can be split evenly
+    while remaining > 2 * fullSize:
+        plan.append((maxOutputs, maxPadding))
+        remaining -= fullSize
+    if remaining <= 0:
+        return plan
+    # cut the rest in as few transactions as possible of about the same size
+    parts = -(-remaining // fullSize)
+    while parts > 1 and remaining // parts < smallest:
+        parts -= 1
+    for part in range(parts):
+        if remaining <= 0:
+            break
+        target = remaining // (parts - part)
+        tx = closestTx(max(target, smallest), maxOutputs, maxPadding, txSize, max(tolerance // parts, 0))
+        if tx is None:
+            tx = closestTx(max(target, smallest), maxOutputs, maxPadding, txSize, fullSize)
+        plan.append(tx)
+        remaining -= txSize(*tx)
+    return plan
+
+def plannedTxSizes(plan, scriptSize, extraScriptLens=()):
+    """smallest size of each signed transaction of a plan"""
+    return [signedTxSize([scriptSize(padding)] * outputs + list(extraScriptLens)) for outputs, padding in plan]
+
+def plannedSize(plan, scriptSize, extraScriptLens=()):
+    """expected total size of the signed transactions of a plan"""
+    return sum(plannedTxSizes(plan, scriptSize, extraScriptLens))
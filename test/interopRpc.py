@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    JSON-RPC 2.0 batch requests to the clients under test.
+
+    The test_framework proxies send one HTTP request per call. RpcBatch
+    collects any number of calls for a node and sends them as a single batch
+    array, results come back in the order the calls were added.
+
+    Usages:
+
+    batch = RpcBatch(rpc_url(0))
+    batch.add("getblockcount")
+    batch.add("getaddressforms", addr)
+    (count, countErr), (forms, formsErr) = batch.execute()
+
+    # same node as a test_framework proxy, failed calls raise JSONRPCException
+    batch = proxyBatch(node)
+    call = batch.add("sendrawtransaction", txHex)
+    txid = replyResult(batch.execute()[call])
+"""
+import base64
+import decimal
+import http.client
+import json
+import urllib.parse
+from test_framework.util import rpc_url
+from test_framework.authproxy import JSONRPCException
+
+HTTP_TIMEOUT = 60*60
+
+# JSON-RPC error code returned for RPCs the client does not implement
+RPC_METHOD_NOT_FOUND = -32601
+
+def EncodeDecimal(o):
+    if isinstance(o, decimal.Decimal):
+        return float(round(o, 8))
+    raise TypeError(repr(o) + " is not JSON serializable")
+
+class RpcBatch(object):
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        """
+        Input:
+            url : RPC url of the node including credentials, see test_framework.util.rpc_url
+            timeout : HTTP timeout in seconds
+        """
+        self.url = urllib.parse.urlparse(url)
+        self.timeout = timeout
+        self.calls = []
+        authpair = ("%s:%s" % (urllib.parse.unquote(self.url.username or ""),
+                               urllib.parse.unquote(self.url.password or ""))).encode("utf8")
+        self.authHeader = b"Basic " + base64.b64encode(authpair)
+
+    def __len__(self):
+        return len(self.calls)
+
+    def add(self, method, *params):
+        """queue a call, return its position in the results of execute()"""
+        self.calls.append({"jsonrpc": "2.0", "id": len(self.calls), "method": method, "params": list(params)})
+        return len(self.calls) - 1
+
+    def execute(self):
+        """
+        Send every queued call in one HTTP request and clear the queue
+        Return:
+            list of (result, error) tuples in the order the calls were added,
+            error is None or the JSON-RPC error object {"code":..., "message":...}
+        """
+        if not self.calls:
+            return []
+        calls = self.calls
+        self.calls = []
+        body = json.dumps(calls, default=EncodeDecimal).encode("utf8")
+        conn = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+        try:
+            conn.request("POST", self.url.path or "/", body,
+                         {"Authorization": self.authHeader, "Content-type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+        try:
+            replies = json.loads(data.decode("utf8"), parse_float=decimal.Decimal)
+        except ValueError:
+            replies = None
+        if not isinstance(replies, list):
+            # the whole batch was rejected, e.g. bad authentication or malformed request
+            error = replies.get("error") if isinstance(replies, dict) else None
+            error = error or {"code": response.status, "message": response.reason}
+            return [(None, error)] * len(calls)
+        results = [(None, {"code": None, "message": "no reply to this call"})] * len(calls)
+        for reply in replies:
+            results[reply["id"]] = (reply.get("result"), reply.get("error"))
+        return results
+
+def nodeBatch(nodeId, timeout=HTTP_TIMEOUT):
+    """RpcBatch for the node started with index nodeId"""
+    return RpcBatch(rpc_url(nodeId), timeout)
+
+def proxyBatch(node, timeout=HTTP_TIMEOUT):
+    """RpcBatch sending to the node behind a test_framework proxy, e.g. self.nodes[0]"""
+    return RpcBatch(node.url, timeout)
+
+def replyResult(reply):
+    """result of one (result, error) reply of RpcBatch.execute, raise JSONRPCException for an error"""
+    result, error = reply
+    if error is not None:
+        raise JSONRPCException(error)
+    return result
+
+def batchCall(nodeId, calls, timeout=HTTP_TIMEOUT):
+    """
+    Send a list of calls to one node in a single request
+    Input:
+        nodeId : index of the node in self.nodes
+        calls : list of (method, param, ...) tuples
+    Return:
+        list of (result, error) tuples, see RpcBatch.execute
+    """
+    batch = nodeBatch(nodeId, timeout)
+    for call in calls:
+        batch.add(*call)
+    return batch.execute()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Harness side signing of the transactions used to fill large blocks.
+
+    signrawtransaction costs one RPC and one single threaded signature in the
+    node for every transaction. LocalSigner exports the private key of every
+    spent address with dumpprivkey once, computes the FORKID signature hash
+    with the test_framework and signs the transactions in a pool of worker
+    processes. The node only receives already signed transactions.
+
+    The outputs of the node wallet that can be spent are P2PKH outputs (the
+    addresses made by getnewaddress) and P2PK outputs (the coinbases of the
+    blocks the node mines). The wallet keys must be compressed, the size of a
+    signed input is planned for a compressed public key, see signedInputSize.
+
+    The worker processes of a signer are started by its first large sign()
+    and reused by the next ones. They are started again only when new keys
+    were exported, and stopped by closeSigners(), which also runs at exit.
+
+    Usages:
+
+    signer = nodeSigner(node)
+    for txHex, txid in signer.sign([(rawTxHex, [utxo])]):
+        node.sendrawtransaction(txHex)
+    closeSigners()  # before the nodes are stopped and started again
+"""
+import atexit
+import multiprocessing
+from binascii import hexlify, unhexlify
+from test_framework.key import CECKey
+from test_framework.mininode import CTransaction, FromHex, COIN
+from test_framework.script import CScript, SignatureHashForkId, SIGHASH_ALL, SIGHASH_FORKID, OP_CHECKSIG, hash160
+from cashaddress.base58check import b58decode_check
+
+SIGHASH_ALL_FORKID = SIGHASH_ALL | SIGHASH_FORKID
+
+# size added to a transaction by the scriptSig of a signed P2PKH input with a
+# compressed key, the DER signature is 70 to 72 bytes long
+SIGNED_INPUT_SIZE = 107
+# size added by the scriptSig of a signed P2PK input, the signature push alone
+SIGNED_P2PK_INPUT_SIZE = 73
+
+# signatures made again at most for a transaction that must not be shorter
+# than its planned size, see signTx
+SHORT_SIGNATURE_RETRIES = 8
+
+# under this number of transactions signing in the calling process is faster
+# than starting the worker processes
+MIN_POOL_TXNS = 8
+
+# workers are started from a clean server process rather than forked, so
+# signing is safe from the threads of forEachNode
+POOL_START_METHOD = "forkserver"
+
+class SigningError(Exception):
+    pass
+
+def decodeWif(wif):
+    """return the 32 byte secret and the compressed flag of a WIF private key"""
+    payload = b58decode_check(wif)
+    if len(payload) not in (33, 34):
+        raise SigningError("Unexpected WIF private key length %d" % len(payload))
+    return payload[1:33], len(payload) == 34 and payload[33] == 1
+
+def makeKey(secret, compressed):
+    key = CECKey()
+    key.set_secretbytes(secret)
+    key.set_compressed(compressed)
+    return key
+
+def p2pkhHash(scriptPubKey):
+    """hash160 of a P2PKH output script, None for any other script"""
+    if len(scriptPubKey) == 25 and scriptPubKey[:3] == b"\x76\xa9\x14" and scriptPubKey[23:] == b"\x88\xac":
+        return scriptPubKey[3:23]
+    return None
+
+def p2pkKey(scriptPubKey):
+    """compressed public key of a P2PK output script, None for any other script"""
+    if len(scriptPubKey) == 35 and scriptPubKey[0] == 33 and scriptPubKey[34] == OP_CHECKSIG:
+        return scriptPubKey[1:34]
+    return None
+
+def signedInputSize(scriptHex):
+    """size added to a transaction by signing an input spending the hex output script"""
+    if p2pkKey(unhexlify(scriptHex)) is not None:
+        return SIGNED_P2PK_INPUT_SIZE
+    return SIGNED_INPUT_SIZE
+
+# keys of the current process indexed by the hash160 of their public key, set by initWorker
+workerKeys = {}
+
+def initWorker(secrets):
+    workerKeys.clear()
+    for secret, compressed in secrets:
+        key = makeKey(secret, compressed)
+        workerKeys[hash160(key.get_pubkey())] = key
+
+def signTx(job):
+    """
+    Sign every input of a transaction with SIGHASH_ALL|SIGHASH_FORKID. A DER
+    signature whose r or s starts with a zero byte is shorter than usual, the
+    inputs are signed again (with a new random nonce) while the transaction
+    is shorter than its minimum size.
+    Input:
+        job : (raw transaction hex, list of (scriptPubKey hex, amount in satoshis) of the spent outputs,
+               minimum size of the signed transaction)
+    Return:
+        signed transaction hex and its txid
+    """
+    txHex, prevouts, minSize = job
+    tx = FromHex(CTransaction(), txHex)
+    inputs = []
+    for i, (scriptHex, amount) in enumerate(prevouts):
+        script = unhexlify(scriptHex)
+        pubkey = p2pkKey(script)
+        key = workerKeys.get(hash160(pubkey) if pubkey is not None else p2pkhHash(script))
+        if key is None:
+            raise SigningError("No key to spend output script %s" % scriptHex)
+        # the FORKID signature hash does not cover the scriptSigs
+        inputs.append((key, pubkey, SignatureHashForkId(CScript(script), tx, i, SIGHASH_ALL_FORKID, amount)))
+    for attempt in range(SHORT_SIGNATURE_RETRIES + 1):
+        for i, (key, pubkey, sighash) in enumerate(inputs):
+            sig = key.sign(sighash) + bytes((SIGHASH_ALL_FORKID,))
+            if pubkey is not None:
+                tx.vin[i].scriptSig = CScript([sig])
+            else:
+                tx.vin[i].scriptSig = CScript([sig, key.get_pubkey()])
+        raw = tx.serialize()
+        if len(raw) >= minSize:
+            break
+    tx.rehash()
+    return hexlify(raw).decode("utf-8"), tx.hash
+
+class LocalSigner(object):
+    def __init__(self, node, processes=None):
+        """
+        Input:
+            node : client whose wallet owns the spent outputs
+            processes : number of worker processes, all cores by default
+        """
+        self.node = node
+        self.processes = processes
+        self.secrets = {}
+        # worker processes and the keys they were started with
+        self.pool = None
+        self.poolSecrets = None
+
+    def exportKeys(self, addresses):
+        """fetch with dumpprivkey the keys of the addresses not exported yet"""
+        for address in addresses:
+            if address not in self.secrets:
+                secret, compressed = decodeWif(self.node.dumpprivkey(address))
+                if not compressed:
+                    raise SigningError("Uncompressed key of %s, signed input sizes assume compressed keys" % address)
+                self.secrets[address] = (secret, compressed)
+
+    def sign(self, txns, minSizes=None):
+        """
+        Input:
+            txns : list of (raw transaction hex, utxos spent by its inputs in
+                   input order as returned by listunspent)
+            minSizes : size under which each signed transaction is signed again, see signTx
+        Return:
+            list of (signed transaction hex, txid) in the order of txns
+        """
+        self.exportKeys(utxo["address"] for _, utxos in txns for utxo in utxos)
+        if minSizes is None:
+            minSizes = [0] * len(txns)
+        jobs = [(txHex, [(utxo["scriptPubKey"], int(utxo["amount"] * COIN)) for utxo in utxos], minSize)
+                for (txHex, utxos), minSize in zip(txns, minSizes)]
+        secrets = sorted(set(self.secrets.values()))
+        if self.processes == 1 or len(jobs) < MIN_POOL_TXNS:
+            initWorker(secrets)
+            return [signTx(job) for job in jobs]
+        return self.workers(secrets).map(signTx, jobs)
+
+    def workers(self, secrets):
+        """pool of worker processes holding the keys secrets, started again when keys were added"""
+        if self.pool is not None and self.poolSecrets != secrets:
+            self.close()
+        if self.pool is None:
+            context = multiprocessing.get_context(POOL_START_METHOD)
+            self.pool = context.Pool(self.processes, initWorker, (secrets,))
+            self.poolSecrets = secrets
+        return self.pool
+
+    def close(self):
+        """stop the worker processes, the next large sign() starts new ones"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.poolSecrets = None
+
+signers = {}
+
+def nodeSigner(node):
+    """LocalSigner of a node, kept for the whole test so that every key is only exported once"""
+    signer = signers.get(node)
+    if signer is None:
+        signer = LocalSigner(node)
+        signers[node] = signer
+    return signer
+
+def closeSigners():
+    """stop the worker processes of every signer and forget the signers"""
+    for signer in signers.values():
+        signer.close()
+    signers.clear()
+
+atexit.register(closeSigners)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Cache of the node datadirs at the end of the setup phase of a test.
+
+    A snapshot is keyed by the hash of every client binary, the bitcoin.conf
+    options and a description of the state built by the setup (number of
+    addresses, UTXOs per node...). Rebuilding a client or changing the setup
+    gives a new key, and saving a snapshot removes the older ones of the same
+    test. The nodes must be stopped while a snapshot is saved or restored.
+
+    The bitcoin.conf of a node is not part of its snapshot: restore() keeps the
+    one the framework wrote for the current run, so restore after the datadirs
+    were initialized (setup_chain) and before the nodes are started.
+
+    Snapshots are kept in ~/.cache/cashInterop/snapshots, set the
+    CASHINTEROP_SNAPSHOTS environment variable to use another folder.
+
+    A client whose tip is more than 24 hours old is in initial block
+    download: it does not relay transactions and serves blocks differently.
+    The tip of a snapshot ages like any other, so a test restoring a
+    snapshot must mine a block (with the current time) before testing relay.
+
+    Usages:
+
+    snapshot = ChainSnapshot("largeblock", self.bins, bitcoinConf, {"addrs": 50, "utxos": [3000, 6000, 3000, 3000]})
+    meta = snapshot.restore(self.options.tmpdir, len(self.bins))  # None when there is no snapshot yet
+    ...  # start the nodes, then when meta is not None
+    self.nodes[0].generate(1)  # a fresh tip
+    ...
+    snapshot.save(self.options.tmpdir, len(self.bins), {"addrs0": self.addrs0})
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+SNAPSHOT_DIR = os.environ.get("CASHINTEROP_SNAPSHOTS",
+                              os.path.join(os.path.expanduser("~"), ".cache", "cashInterop", "snapshots"))
+
+# files of a datadir that belong to the running node rather than to its chain and wallet
+RUNTIME_FILES = ("debug.log", ".lock", "bitcoind.pid", ".cookie", "db.log")
+# configuration written by the test framework for the current run, with the
+# p2p and RPC ports it picked: never saved, kept as is by a restore
+CONF_FILE = "bitcoin.conf"
+
+META_FILE = "meta.json"
+
+def fileHash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def snapshotKey(bins, conf, shape):
+    """hash of the client binaries, the configuration and the setup shape"""
+    h = hashlib.sha256()
+    for binary in bins:
+        h.update(fileHash(binary).encode("ascii"))
+    h.update(json.dumps(conf, sort_keys=True, default=str).encode("utf-8"))
+    h.update(json.dumps(shape, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+class ChainSnapshot(object):
+    def __init__(self, name, bins, conf, shape, cacheDir=SNAPSHOT_DIR):
+        """
+        Input:
+            name : name of the test setup, snapshots of the same name replace each other
+            bins : paths of the bitcoind binary of every node
+            conf : bitcoin.conf options given to the test framework
+            shape : JSON serializable description of what the setup builds
+            cacheDir : folder holding the snapshots
+        """
+        self.name = name
+        self.cacheDir = cacheDir
+        self.key = snapshotKey(bins, conf, shape)
+        self.path = os.path.join(cacheDir, "%s-%s" % (name, self.key))
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, META_FILE))
+
+    def restore(self, tmpdir, numNodes):
+        """
+        Replace the datadirs of the nodes with the snapshot, its tip may be
+        older than a day: mine a block once the nodes are started
+        Return:
+            metadata given to save, None when there is no snapshot for this key
+        """
+        if not self.exists():
+            return None
+        logging.info("Restoring chain snapshot %s" % self.path)
+        for i in range(numNodes):
+            datadir = os.path.join(tmpdir, "node%d" % i)
+            conf = os.path.join(datadir, CONF_FILE)
+            if not os.path.isfile(conf):
+                raise AssertionError("%s missing, restore the snapshot after the framework initialized the datadirs" % conf)
+            with open(conf, "rb") as f:
+                confData = f.read()
+            shutil.rmtree(datadir, ignore_errors=True)
+            shutil.copytree(os.path.join(self.path, "node%d" % i), datadir)
+            # the ports picked for this run, not the ones of the run that saved the snapshot
+            with open(conf, "wb") as f:
+                f.write(confData)
+        with open(os.path.join(self.path, META_FILE)) as f:
+            return json.load(f)
+
+    def save(self, tmpdir, numNodes, meta):
+        """store the datadirs of the stopped nodes with the metadata the test needs to resume"""
+        if os.path.isdir(self.cacheDir):
+            # snapshots of older binaries or of another configuration
+            for entry in os.listdir(self.cacheDir):
+                if entry.startswith(self.name + "-") and entry != os.path.basename(self.path):
+                    shutil.rmtree(os.path.join(self.cacheDir, entry), ignore_errors=True)
+        building = self.path + ".tmp"
+        shutil.rmtree(building, ignore_errors=True)
+        for i in range(numNodes):
+            shutil.copytree(os.path.join(tmpdir, "node%d" % i), os.path.join(building, "node%d" % i),
+                            ignore=shutil.ignore_patterns(CONF_FILE, *RUNTIME_FILES))
+        with open(os.path.join(building, META_FILE), "w") as f:
+            json.dump(meta, f, default=str)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.rename(building, self.path)
+        logging.info("Saved chain snapshot %s" % self.path)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Wait for the nodes to agree on their tip or mempool using the ZMQ
+    notifications of the clients instead of sleeping between RPC polls.
+
+    Every client built with ZMQ is started with -zmqpubhashblock and
+    -zmqpubhashtx on a local port. A listener thread subscribes to all of them
+    and records when each node announced each block and transaction. A wait
+    checks the nodes over RPC, then sleeps until the next notification rather
+    than for a fixed period. Clients built without ZMQ, or a harness without
+    the python zmq module, are polled every POLL_INTERVAL seconds.
+
+    Usages:
+
+    args = zmqArgs(self.bins)
+    self.nodes = start_nodes(len(self.bins), self.options.tmpdir, args, binary=self.bins)
+    self.waiter = SyncWaiter(self.nodes, args)
+    self.waiter.syncBlocks()
+    self.waiter.syncMempools(self.nodes[0:2])
+    self.waiter.arrivals(blockHash)  # {node index: time the node announced it}
+    self.waiter.startPolling()  # arrivals of the nodes without ZMQ too
+    self.waiter.close()
+"""
+import logging
+import subprocess
+import threading
+import time
+from binascii import hexlify
+from test_framework.util import rpc_port
+from test_framework.authproxy import AuthServiceProxy
+from interopUtils import NodeGroup
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+# the notification ports are above the RPC port range of the test framework
+ZMQ_PORT_OFFSET = 5000
+
+# seconds between two RPC polls of the nodes publishing no notification
+POLL_INTERVAL = 0.25
+# seconds between two RPC polls when every node notifies, which catches what
+# no notification announces (a transaction leaving a mempool...)
+NOTIFIED_POLL_INTERVAL = 1.0
+
+# a burst of notifications (every transaction of a block...) is checked at
+# most once per this many seconds
+MIN_CHECK_INTERVAL = 0.05
+
+# seconds before a sync gives up, sync_blocks and sync_mempools of the test framework wait as long
+SYNC_TIMEOUT = 60
+
+# seconds between two polls of the nodes publishing no notification while
+# arrivals are recorded, see SyncWaiter.startPolling. A poll costs three
+# small RPCs, getrawmempool is only called when the mempool size changed.
+ARRIVAL_POLL_INTERVAL = 0.05
+
+TOPICS = (b"hashblock", b"hashtx")
+# kind of object announced by each notification topic
+TOPIC_KINDS = {b"hashblock": "block", b"hashtx": "tx"}
+
+zmqBinaries = {}
+
+def zmqSupported(binary):
+    """True when the client binary was built with ZMQ notifications"""
+    if binary not in zmqBinaries:
+        try:
+            out = subprocess.run([binary, "-help"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60).stdout
+            zmqBinaries[binary] = b"-zmqpubhashblock" in out
+        except (OSError, subprocess.SubprocessError):
+            zmqBinaries[binary] = False
+    return zmqBinaries[binary]
+
+def zmqEndpoint(n):
+    return "tcp://127.0.0.1:%d" % (rpc_port(n) + ZMQ_PORT_OFFSET)
+
+def zmqArgs(bins):
+    """
+    Input:
+        bins : bitcoind binary of every node
+    Return:
+        extra command line arguments of every node for start_nodes
+    """
+    args = []
+    for n, binary in enumerate(bins):
+        if zmq is not None and zmqSupported(binary):
+            args.append(["-zmqpubhashblock=" + zmqEndpoint(n), "-zmqpubhashtx=" + zmqEndpoint(n)])
+        else:
+            args.append([])
+    return args
+
+def txidDigest(txids):
+    """order independent digest of a list of txids"""
+    digest = 0
+    for txid in txids:
+        digest ^= int(txid, 16)
+    return digest
+
+def newBlocks(proxy, header, lastTip, lastHeight):
+    """
+    Blocks a node connected since its tip was lastTip at lastHeight, walking
+    back from the header of its new tip. After a reorg the walk stops at the
+    last height, the new blocks below it are not reported.
+    Input:
+        proxy : RPC connection of the node
+        header : getblockheader of the new tip
+    Return:
+        list of block hashes, the tip first
+    """
+    blocks = []
+    while header["hash"] != lastTip:
+        blocks.append(header["hash"])
+        if header["height"] <= lastHeight or "previousblockhash" not in header:
+            break
+        header = proxy.getblockheader(header["previousblockhash"])
+    return blocks
+
+class MempoolComparison(object):
+    """
+    Compare the mempools of the nodes from the cheapest to the most costly
+    data: getmempoolinfo size and bytes, then a digest of the txids, and only
+    when a difference must be measured the sets of txids.
+    """
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.infos = NodeGroup(nodes).getmempoolinfo()
+        self.txids = None
+
+    def sizes(self):
+        return [info["size"] for info in self.infos]
+
+    def rawMempools(self):
+        if self.txids is None:
+            self.txids = NodeGroup(self.nodes).getrawmempool()
+        return self.txids
+
+    def same(self):
+        """True when every node has the same mempool"""
+        if len(set((info["size"], info["bytes"]) for info in self.infos)) != 1:
+            return False
+        return len(set(txidDigest(txids) for txids in self.rawMempools())) == 1
+
+    def differences(self, limit):
+        """
+        number of transactions not in both the first node and each other node
+        mempool, any number at or above limit when the sizes already differ by limit
+        """
+        sizes = self.sizes()
+        if any(abs(size - sizes[0]) >= limit for size in sizes[1:]):
+            return [abs(size - sizes[0]) for size in sizes[1:]]
+        pools = [set(txids) for txids in self.rawMempools()]
+        return [len(pool.symmetric_difference(pools[0])) for pool in pools[1:]]
+
+class SyncWaiter(object):
+    def __init__(self, nodes, args, timeout=SYNC_TIMEOUT):
+        """
+        Input:
+            nodes : running clients
+            args : extra arguments the clients were started with, as returned by zmqArgs
+            timeout : seconds before a sync gives up when the call gives no timeout
+        """
+        self.nodes = nodes
+        self.timeout = timeout
+        self.lock = threading.Condition()
+        # number of notifications received, a waiter sleeps until it changes
+        self.events = 0
+        # hash hex -> {node index: arrival time}
+        self.seen = {}
+        # hash hex -> "block" or "tx"
+        self.kinds = {}
+        self.running = True
+        self.poller = None
+        self.sockets = {}
+        if zmq is not None:
+            self.context = zmq.Context()
+            for n, nodeArgs in enumerate(args):
+                if not nodeArgs:
+                    continue
+                sock = self.context.socket(zmq.SUB)
+                for topic in TOPICS:
+                    sock.setsockopt(zmq.SUBSCRIBE, topic)
+                sock.connect(zmqEndpoint(n))
+                self.sockets[sock] = n
+        if self.sockets:
+            self.thread = threading.Thread(target=self.listen, daemon=True)
+            self.thread.start()
+        else:
+            self.thread = None
+        logging.info("sync waiter: %d of %d nodes notify over ZMQ" % (len(self.sockets), len(nodes)))
+
+    def listen(self):
+        poller = zmq.Poller()
+        for sock in self.sockets:
+            poller.register(sock, zmq.POLLIN)
+        while self.running:
+            ready = dict(poller.poll(100))
+            now = time.time()
+            for sock, n in self.sockets.items():
+                if sock not in ready:
+                    continue
+                while True:
+                    try:
+                        topic, body, seq = sock.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    with self.lock:
+                        # the clients publish the hash in RPC byte order
+                        self.record(n, TOPIC_KINDS.get(topic), hexlify(body).decode("ascii"), now)
+            if ready:
+                with self.lock:
+                    self.lock.notify_all()
+
+    def record(self, n, kind, hashHex, when):
+        """note the first time node n announced a block or transaction, the lock must be held"""
+        self.seen.setdefault(hashHex, {}).setdefault(n, when)
+        self.kinds.setdefault(hashHex, kind)
+        self.events += 1
+
+    def startPolling(self, interval=ARRIVAL_POLL_INTERVAL):
+        """
+        Record the arrivals on the nodes publishing no notification as well, by
+        polling their tip and mempool from a thread with its own RPC connections.
+        Every block between two polled tips arrives at the time of the second poll.
+        """
+        notifying = set(self.sockets.values())
+        polled = [n for n in range(len(self.nodes)) if n not in notifying]
+        if polled and self.poller is None:
+            self.poller = threading.Thread(target=self.poll, args=(polled, interval), daemon=True)
+            self.poller.start()
+
+    def poll(self, polled, interval):
+        proxies = {n: AuthServiceProxy(self.nodes[n].url) for n in polled}
+        # node index -> (tip hash, tip height), getmempoolinfo (size, bytes) and txids at the last poll
+        tips = {}
+        infos = {}
+        pools = {}
+        while self.running:
+            for n, proxy in proxies.items():
+                try:
+                    tip = proxy.getbestblockhash()
+                    blocks = []
+                    if n in tips and tip == tips[n][0]:
+                        height = tips[n][1]
+                    else:
+                        header = proxy.getblockheader(tip)
+                        height = header["height"]
+                        if n in tips:
+                            blocks = newBlocks(proxy, header, *tips[n])
+                    info = proxy.getmempoolinfo()
+                    info = (info["size"], info["bytes"])
+                    # the txids are only fetched when the mempool changed
+                    if n in pools and info == infos[n] and not blocks:
+                        txids = pools[n]
+                    else:
+                        txids = set(proxy.getrawmempool())
+                except Exception:
+                    continue  # the node is stopping or busy, look again at the next poll
+                now = time.time()
+                # what the node has at the first poll did not arrive while polling
+                arrived = txids - pools[n] if n in pools else ()
+                if blocks or arrived:
+                    with self.lock:
+                        for block in blocks:
+                            self.record(n, "block", block, now)
+                        for txid in arrived:
+                            self.record(n, "tx", txid, now)
+                        self.lock.notify_all()
+                tips[n] = (tip, height)
+                infos[n] = info
+                pools[n] = txids
+            time.sleep(interval)
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        if self.poller is not None:
+            self.poller.join()
+        for sock in self.sockets:
+            sock.close(0)
+        self.sockets = {}
+        if zmq is not None:
+            self.context.term()
+
+    def arrivals(self, hashHex):
+        """{node index: time} at which every node announced a block or transaction"""
+        with self.lock:
+            return dict(self.seen.get(hashHex, {}))
+
+    def announced(self):
+        """{hash hex: (kind, {node index: time})} of everything announced so far"""
+        with self.lock:
+            return {h: (self.kinds.get(h), dict(nodes)) for h, nodes in self.seen.items()}
+
+    def notified(self, nodes):
+        """True when every node of the list publishes notifications"""
+        indexes = set(self.sockets.values())
+        return all(any(x is n for i, x in enumerate(self.nodes) if i in indexes) for n in nodes)
+
+    def waitFor(self, check, nodes, timeout, what):
+        """
+        Call check until it returns True, sleeping until the next notification
+        or for the poll interval
+        Input:
+            check : function called with the elapsed seconds
+            nodes : clients the check looks at
+            timeout : seconds before giving up
+            what : description of the wait for the error
+        """
+        interval = NOTIFIED_POLL_INTERVAL if self.notified(nodes) else POLL_INTERVAL
+        start = time.time()
+        while True:
+            with self.lock:
+                events = self.events
+            elapsed = time.time() - start
+            if check(elapsed):
+                return elapsed
+            if elapsed > timeout:
+                raise AssertionError("%s not reached in %d seconds" % (what, timeout))
+            with self.lock:
+                # a check only tells something new after a notification (or the poll period)
+                self.lock.wait_for(lambda: self.events != events, interval)
+            time.sleep(MIN_CHECK_INTERVAL)
+
+    def syncBlocks(self, nodes=None, timeout=None):
+        """wait until the nodes have the same tip, replaces sync_blocks (timeout defaults to self.timeout)"""
+        nodes = nodes or self.nodes
+        return self.waitFor(lambda elapsed: len(set(NodeGroup(nodes).getbestblockhash())) == 1,
+                            nodes, timeout or self.timeout, "same tip")
+
+    def syncMempools(self, nodes=None, timeout=None):
+        """wait until the nodes have the same mempool, replaces sync_mempools (timeout defaults to self.timeout)"""
+        nodes = nodes or self.nodes
+        return self.waitFor(lambda elapsed: MempoolComparison(nodes).same(), nodes, timeout or self.timeout,
+                            "same mempool")
+
+    def mostlySyncMempools(self, nodes=None, difference=50, grace=10, timeout=None, verbose=1):
+        """
+        Wait until the nodes have mostly the same mempool, replaces
+        mostly_sync_mempools. There is no guarantee that mempools will ever
+        sync due to the filterInventoryKnown bloom filter, so after grace
+        seconds up to difference transactions may differ from the first node.
+        The timeout defaults to self.timeout.
+        """
+        nodes = nodes or self.nodes
+        logged = [-1]
+        def check(elapsed):
+            pools = MempoolComparison(nodes)
+            if verbose and int(elapsed) != logged[0]:  # once a second
+                logged[0] = int(elapsed)
+                logging.info("sync mempool: " + str(pools.sizes()))
+            if pools.same():
+                return True
+            if elapsed < grace:
+                return False
+            return all(d < difference for d in pools.differences(difference))
+        return self.waitFor(check, nodes, timeout or self.timeout, "mostly same mempool")
+
+    def waitHeights(self, heights, timeout=10):
+        """
+        Wait until every node has its expected block count, replaces expectHeights
+        Return:
+            True on success, False when timeout seconds went by first
+        """
+        try:
+            self.waitFor(lambda elapsed: NodeGroup(self.nodes).getblockcount() == heights,
+                         self.nodes, timeout, "heights %s" % heights)
+        except AssertionError:
+            return False
+        return True
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Unit tests of the harness helpers that need no running client, the RPCs
+    they use are answered by fake nodes.
+
+    Usages:
+
+    ./interopTest.py
+"""
+import decimal
+import os
+import tempfile
+import unittest
+from binascii import hexlify, unhexlify
+from test_framework.mininode import CTransaction, FromHex, COIN
+from test_framework.script import CScript, SignatureHashForkId, hash160, OP_DUP, OP_HASH160, OP_EQUALVERIFY, OP_CHECKSIG
+from cashaddress.base58check import b58encode_check
+from interopUtxo import UtxoPool, FanOut, p2pkhScript, P2PKH, P2PK
+from interopSigner import makeKey, SIGHASH_ALL_FORKID
+from interopSync import newBlocks
+from interopLatency import percentile, PropagationRecorder
+from interopSnapshot import ChainSnapshot
+from interopUtils import ScriptTemplate, HASH160_HOLE, forEachNode
+from interopPlanner import planTransactions, plannedSize, closestTx, signedTxSize, PLAN_TOLERANCE
+
+ADDRESS = "mxdyGMESdXzVNyiZM4UnSKQRQsXxD8HfXp"
+# <33 byte compressed pubkey> OP_CHECKSIG, what the clients pay coinbases to
+P2PK_SCRIPT = "21" + "02" + "11" * 32 + "ac"
+
+def coin(txid, amount, vout=0, script=None):
+    return {"txid": txid, "vout": vout, "address": ADDRESS, "amount": decimal.Decimal(amount),
+            "scriptPubKey": script or p2pkhScript(ADDRESS)}
+
+class FakeWallet(object):
+    """node answering the wallet RPCs of UtxoPool"""
+    def __init__(self, unspent=(), height=200):
+        self.unspent = list(unspent)
+        self.height = height
+        self.tip = "00" * 32
+        # entries returned by listsinceblock
+        self.since = []
+        # (txid, vout) -> gettxout result
+        self.txouts = {}
+
+    def listunspent(self):
+        return list(self.unspent)
+
+    def getbestblockhash(self):
+        return self.tip
+
+    def getblockcount(self):
+        return self.height
+
+    def listsinceblock(self, block):
+        return {"lastblock": self.tip, "transactions": list(self.since)}
+
+    def gettxout(self, txid, vout):
+        return self.txouts.get((txid, vout))
+
+class FakeNode(FakeWallet):
+    """node whose wallet holds the single key secret, answering the RPCs of FanOut"""
+    def __init__(self, secret, unspent=(), height=200):
+        FakeWallet.__init__(self, unspent, height)
+        self.wif = b58encode_check(b"\xef" + secret + b"\x01").decode("ascii")  # compressed regtest key
+        self.sent = []
+        self.mined = 0
+
+    def dumpprivkey(self, address):
+        return self.wif
+
+    def getnetworkinfo(self):
+        return {"relayfee": decimal.Decimal("0.00001")}
+
+    def sendrawtransaction(self, txHex):
+        tx = FromHex(CTransaction(), txHex)
+        tx.rehash()
+        self.sent.append(tx)
+        return tx.hash
+
+    def generate(self, blocks):
+        self.mined += blocks
+
+class NodeFanOut(FanOut):
+    """FanOut sending through the node object rather than JSON-RPC batches to its url"""
+    def submit(self, signed):
+        for txHex, txid in signed:
+            assert self.node.sendrawtransaction(txHex) == txid
+
+class TestUtxoPool(unittest.TestCase):
+    def test_largest_first(self):
+        pool = UtxoPool(FakeWallet([coin("a", 1), coin("b", 50), coin("c", 5)]))
+        pool.sync()
+        self.assertEqual([pool.pop()["txid"] for _ in range(3)], ["b", "c", "a"])
+        self.assertRaises(IndexError, pool.pop)
+
+    def test_pop_accept(self):
+        pool = UtxoPool(FakeWallet([coin("a", 1), coin("b", 50), coin("c", 5)]))
+        pool.sync()
+        self.assertEqual(pool.pop(lambda utxo: utxo["amount"] < 10)["txid"], "c")
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.pop()["txid"], "b")
+        self.assertRaises(IndexError, pool.pop, lambda utxo: False)
+        self.assertEqual(len(pool), 1)
+
+    def test_pop_kinds(self):
+        pool = UtxoPool(FakeWallet([coin("cb1", 50, script=P2PK_SCRIPT), coin("cb2", 50, vout=1, script=P2PK_SCRIPT),
+                                    coin("a", 1), coin("b", 5)]))
+        pool.sync()
+        coinbases = list(pool.heaps[(P2PK, True)])
+        self.assertEqual(pool.pop(kinds=[P2PKH])["txid"], "b")
+        # the larger coinbases were not popped and pushed back
+        self.assertEqual(pool.heaps[(P2PK, True)], coinbases)
+        self.assertEqual(pool.pop()["txid"], "cb1")
+        self.assertEqual(pool.pop(kinds=[P2PKH])["txid"], "a")
+        self.assertRaises(IndexError, pool.pop, kinds=[P2PKH])
+        self.assertEqual(len(pool), 1)
+
+    def test_sync_dedup(self):
+        node = FakeWallet()
+        pool = UtxoPool(node)
+        pool.sync()
+        node.since = [{"txid": "r", "vout": 1, "address": ADDRESS, "amount": decimal.Decimal(2), "category": "receive"},
+                      {"txid": "s", "vout": 0, "address": ADDRESS, "amount": decimal.Decimal(3), "category": "send"}]
+        pool.sync()
+        pool.sync()
+        self.assertEqual(len(pool), 1)
+        utxo = pool.pop()
+        self.assertEqual((utxo["txid"], utxo["vout"]), ("r", 1))
+        self.assertEqual(utxo["scriptPubKey"], p2pkhScript(ADDRESS))
+        # a spent coin is not brought back by the next sync
+        pool.sync()
+        self.assertEqual(len(pool), 0)
+
+    def test_spent_never_added(self):
+        node = FakeWallet()
+        pool = UtxoPool(node)
+        pool.sync()
+        pool.spent({"txid": "r", "vout": 0})
+        node.since = [{"txid": "r", "vout": 0, "address": ADDRESS, "amount": decimal.Decimal(2), "category": "receive"}]
+        pool.sync()
+        self.assertEqual(len(pool), 0)
+
+    def test_coinbase_maturity(self):
+        node = FakeWallet(height=200)
+        pool = UtxoPool(node)
+        pool.sync()
+        node.since = [{"txid": "cb", "vout": 0, "address": ADDRESS, "amount": decimal.Decimal(50),
+                       "category": "immature", "confirmations": 1}]
+        node.txouts[("cb", 0)] = {"scriptPubKey": {"hex": P2PK_SCRIPT}}
+        pool.sync()
+        self.assertEqual(len(pool), 0)
+        node.height = 299
+        pool.sync()
+        self.assertEqual(len(pool), 0)
+        node.height = 300
+        pool.sync()
+        self.assertEqual(len(pool), 1)
+        # the real P2PK script, not the P2PKH script of the key address
+        self.assertEqual(pool.pop()["scriptPubKey"], P2PK_SCRIPT)
+
+    def test_spent_coinbase_skipped(self):
+        node = FakeWallet()
+        pool = UtxoPool(node)
+        pool.sync()
+        node.since = [{"txid": "cb", "vout": 0, "address": ADDRESS, "amount": decimal.Decimal(50), "category": "generate"}]
+        pool.sync()
+        self.assertEqual(len(pool), 0)
+
+    def test_confirmed(self):
+        node = FakeWallet([coin("a", 1)])
+        pool = UtxoPool(node)
+        pool.sync()
+        pool.add(coin("f", 50))  # output of a transaction the harness just sent
+        self.assertEqual(pool.pop(confirmedOnly=True)["txid"], "a")
+        self.assertRaises(IndexError, pool.pop, confirmedOnly=True)
+        received = {"txid": "f", "vout": 1, "address": ADDRESS, "amount": decimal.Decimal(2),
+                    "category": "receive", "confirmations": 0}
+        node.since = [received]
+        pool.sync()
+        self.assertFalse(pool.confirmed(pool.pop()))
+        received["confirmations"] = 1
+        pool.sync()
+        self.assertEqual(len(pool), 1)
+        self.assertTrue(pool.confirmed(pool.pop()))
+
+    def test_restore_and_quarantine(self):
+        node = FakeWallet([coin("a", 1), coin("b", 50)])
+        pool = UtxoPool(node)
+        pool.sync()
+        utxo = pool.pop()
+        pool.restore(utxo)
+        self.assertEqual(pool.pop()["txid"], "b")
+        pool.quarantine(utxo, "bad-txns")
+        self.assertEqual(pool.quarantined, {("b", 0): "bad-txns"})
+        self.assertEqual(pool.pop()["txid"], "a")
+        self.assertRaises(IndexError, pool.pop)
+        pool.reload()
+        self.assertEqual(pool.quarantined, {})
+        self.assertEqual(len(pool), 2)
+
+class TestFanOut(unittest.TestCase):
+    SECRET = b"\x01" * 32
+
+    def setUp(self):
+        self.key = makeKey(self.SECRET, True)
+        self.address = b58encode_check(b"\x6f" + hash160(self.key.get_pubkey())).decode("ascii")  # regtest P2PKH
+        # <pubkey> OP_CHECKSIG
+        self.coinbaseScript = "21" + hexlify(self.key.get_pubkey()).decode("ascii") + "ac"
+
+    def test_coinbase_only_wallet(self):
+        key, coinbaseScript = self.key, self.coinbaseScript
+        node = FakeNode(self.SECRET, [coin("cb", 50, script=coinbaseScript)])
+        fan = NodeFanOut(node, [self.address], 30, fanout=5)
+        while not fan.done():
+            if not fan.chainable():
+                node.generate(1)
+                fan.confirmed()
+            fan.step()
+        coins = fan.finish()
+        self.assertEqual(len(coins), 30)
+        self.assertEqual(len(fan.pool), 30)
+        self.assertEqual(node.mined, 0)
+        # the coinbase is spent by a P2PK scriptSig holding the signature alone
+        first = node.sent[0]
+        sig, = list(first.vin[0].scriptSig)
+        self.assertEqual(sig[-1], SIGHASH_ALL_FORKID)
+        sighash = SignatureHashForkId(CScript(unhexlify(coinbaseScript)), first, 0, SIGHASH_ALL_FORKID, 50 * COIN)
+        self.assertTrue(key.verify(sighash, sig[:-1]))
+        # the next generation spends P2PKH outputs with the signature and the key
+        self.assertEqual(len(node.sent), 1 + 5)
+        for tx in node.sent[1:]:
+            sig, pubkey = list(tx.vin[0].scriptSig)
+            self.assertEqual(pubkey, key.get_pubkey())
+
+    def test_descendant_limit(self):
+        node = FakeNode(self.SECRET, [coin("cb", 50, script=self.coinbaseScript)])
+        fan = NodeFanOut(node, [self.address], 10 ** 6, fanout=5)
+        fan.step()
+        fan.step()
+        # 5 + 25 descendants of the first transaction
+        self.assertFalse(fan.chainable())
+        self.assertRaises(AssertionError, fan.step)
+        fan.confirmed()
+        self.assertTrue(fan.chainable())
+
+def pushScriptSize(padding):
+    """length of a script pushing padding bytes of junk in front of a P2PKH script"""
+    push = 1 if padding < 76 else 2 if padding < 256 else 3
+    return push + padding + 1 + 25
+
+class TestPlanner(unittest.TestCase):
+    MAX_OUTPUTS = 8
+    MAX_PADDING = 12471
+
+    def test_signed_tx_size(self):
+        # version, 1 input with a 70 byte signature and a compressed key, 1 P2PKH output, lock time
+        self.assertEqual(signedTxSize([25]), 4 + 1 + 41 + 106 + 1 + 34 + 4)
+        self.assertEqual(signedTxSize([25], inputs=2), signedTxSize([25]) + 41 + 106)
+        # the output count and script length grow to 3 byte compact sizes
+        self.assertEqual(signedTxSize([300] * 253) - signedTxSize([300] * 252), 8 + 3 + 300 + 2)
+
+    def test_closest_tx(self):
+        txSize = lambda outputs, padding: signedTxSize([pushScriptSize(padding)] * outputs)
+        for target in (200, 1000, 5000, 50000):
+            outputs, padding = closestTx(target, self.MAX_OUTPUTS, self.MAX_PADDING, txSize, PLAN_TOLERANCE)
+            self.assertTrue(1 <= outputs <= self.MAX_OUTPUTS)
+            self.assertTrue(0 <= padding <= self.MAX_PADDING)
+            self.assertTrue(target <= txSize(outputs, padding) <= target + PLAN_TOLERANCE)
+        # larger than a full transaction
+        self.assertIsNone(closestTx(txSize(self.MAX_OUTPUTS, self.MAX_PADDING) + 1, self.MAX_OUTPUTS,
+                                    self.MAX_PADDING, txSize, PLAN_TOLERANCE))
+
+    def test_plan_hits_target(self):
+        full = signedTxSize([pushScriptSize(self.MAX_PADDING)] * self.MAX_OUTPUTS)
+        targets = [300, 1000, 4321, full, 2 * full, 2 * full + 1, 3 * full - 5,
+                   250000, 1000000, 4000000, 32000000]
+        for extra in [(), (83,)]:
+            for target in targets:
+                plan = planTransactions(target, self.MAX_OUTPUTS, self.MAX_PADDING, pushScriptSize, extra)
+                size = plannedSize(plan, pushScriptSize, extra)
+                self.assertTrue(target <= size <= target + PLAN_TOLERANCE, (target, extra, size))
+                for outputs, padding in plan:
+                    self.assertTrue(1 <= outputs <= self.MAX_OUTPUTS)
+                    self.assertTrue(0 <= padding <= self.MAX_PADDING)
+
+    def test_full_transactions_first(self):
+        plan = planTransactions(4000000, self.MAX_OUTPUTS, self.MAX_PADDING, pushScriptSize)
+        fullCount = sum(1 for tx in plan if tx == (self.MAX_OUTPUTS, self.MAX_PADDING))
+        self.assertEqual(plan[:fullCount], [(self.MAX_OUTPUTS, self.MAX_PADDING)] * fullCount)
+        self.assertTrue(len(plan) - fullCount <= 3)
+
+class FakeChain(object):
+    """node answering getblockheader for a chain of blocks named by their height"""
+    def __init__(self, blocks):
+        self.headers = {}
+        for height, block in enumerate(blocks):
+            self.headers[block] = {"hash": block, "height": height}
+            if height:
+                self.headers[block]["previousblockhash"] = blocks[height - 1]
+
+    def getblockheader(self, block):
+        return self.headers[block]
+
+class TestNewBlocks(unittest.TestCase):
+    def test_walk_back(self):
+        chain = FakeChain(["b0", "b1", "b2", "b3", "b4"])
+        self.assertEqual(newBlocks(chain, chain.getblockheader("b4"), "b1", 1), ["b4", "b3", "b2"])
+        self.assertEqual(newBlocks(chain, chain.getblockheader("b2"), "b1", 1), ["b2"])
+        self.assertEqual(newBlocks(chain, chain.getblockheader("b1"), "b1", 1), [])
+
+    def test_reorg(self):
+        chain = FakeChain(["b0", "b1", "c2", "c3"])
+        # the last tip was b2, the walk stops at its height
+        self.assertEqual(newBlocks(chain, chain.getblockheader("c3"), "b2", 2), ["c3", "c2"])
+
+class FakeWaiter(object):
+    """SyncWaiter whose announcements are set by the test"""
+    def __init__(self, nodes):
+        self.nodes = nodes
+        # hash -> (kind, {node index: time})
+        self.seen = {}
+
+    def startPolling(self):
+        pass
+
+    def announced(self):
+        return self.seen
+
+class FakeMiner(object):
+    def __init__(self):
+        self.blocks = 0
+
+    def generate(self, count):
+        self.blocks += count
+        return ["block%d" % self.blocks]
+
+    def sendrawtransaction(self, txHex):
+        return "tx" + txHex
+
+    def sendtoaddress(self, address, amount):
+        return "pay" + address
+
+class TestLatency(unittest.TestCase):
+    def test_percentile(self):
+        values = [5, 1, 3, 2, 4]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 100), 5)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(list(range(1, 11)), 90), 9)
+        self.assertEqual(percentile(list(range(1, 11)), 99), 10)
+        self.assertEqual(percentile([7], 50), 7)
+
+    def test_samples(self):
+        nodes = [FakeMiner(), FakeMiner(), FakeMiner()]
+        waiter = FakeWaiter(nodes)
+        recorder = PropagationRecorder(waiter, ["bucash", "abc", "bucash"])
+        block, = nodes[1].generate(1)
+        recorder.made[block] = (1, 150.0)  # returned by generate at 150 s
+        recorder.marks = [(0, "setup"), (100, "SIZE_1_MB"), (200, "SIZE_2_MB")]
+        waiter.seen = {
+            # the origin announced the block, latencies start at its announcement
+            block: ("block", {1: 150.5, 0: 151.0, 2: 152.5}),
+            # made by no instrumented RPC, the first announcement is the origin
+            "relayed": ("tx", {2: 250.0, 0: 250.25}),
+        }
+        samples = recorder.samples()
+        self.assertEqual(set(samples), {("SIZE_1_MB", "block"), ("SIZE_2_MB", "tx")})
+        self.assertEqual(samples[("SIZE_1_MB", "block")], {("1:abc", "0:bucash"): [0.5], ("1:abc", "2:bucash"): [2.0]})
+        self.assertEqual(samples[("SIZE_2_MB", "tx")], {("2:bucash", "0:bucash"): [0.25]})
+
+    def test_origin_not_announcing(self):
+        nodes = [FakeMiner(), FakeMiner()]
+        waiter = FakeWaiter(nodes)
+        recorder = PropagationRecorder(waiter, ["bucash", "abc"])
+        txid = nodes[0].sendrawtransaction("00")
+        recorder.made[txid] = (0, 10.0)
+        # a node polled before the origin announced it does not give a negative latency
+        waiter.seen = {txid: ("tx", {1: 9.5})}
+        self.assertEqual(recorder.samples(), {("setup", "tx"): {("0:bucash", "1:abc"): [0]}})
+        self.assertEqual(recorder.workloadAt(10.0), "setup")
+
+class TestScriptTemplate(unittest.TestCase):
+    ELEMENTS = [OP_DUP, OP_HASH160, HASH160_HOLE, OP_EQUALVERIFY, OP_CHECKSIG]
+
+    def test_same_as_cscript(self):
+        template = ScriptTemplate(self.ELEMENTS)
+        h = b"\x42" * 20
+        self.assertEqual(template(h), CScript([OP_DUP, OP_HASH160, h, OP_EQUALVERIFY, OP_CHECKSIG]))
+        self.assertEqual(len(template), 25)
+
+    def test_concurrent_calls(self):
+        template = ScriptTemplate(self.ELEMENTS)
+        hashes = [bytes([n]) * 20 for n in range(8)]
+        def make(node, h):
+            return all(template(h)[3:23] == h for _ in range(2000))
+        results = forEachNode(list(range(len(hashes))), make, hashes)
+        self.assertEqual([result for result, error, seconds in results], [True] * len(hashes))
+
+class TestChainSnapshot(unittest.TestCase):
+    def write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_conf_of_the_run_kept(self):
+        with tempfile.TemporaryDirectory() as folder:
+            binary = os.path.join(folder, "bitcoind")
+            self.write(binary, "client")
+            snapshot = ChainSnapshot("test", [binary], {"debug": ["net"]}, {"utxos": 1}, os.path.join(folder, "cache"))
+            saved = os.path.join(folder, "saved")
+            self.write(os.path.join(saved, "node0", "bitcoin.conf"), "port=11000\n")
+            self.write(os.path.join(saved, "node0", "regtest", "wallet.dat"), "keys")
+            self.write(os.path.join(saved, "node0", "regtest", "debug.log"), "log")
+            snapshot.save(saved, 1, {"addrs": ["a"]})
+            self.assertFalse(os.path.exists(os.path.join(snapshot.path, "node0", "bitcoin.conf")))
+            # a later run whose framework picked other ports
+            run = os.path.join(folder, "run")
+            self.write(os.path.join(run, "node0", "bitcoin.conf"), "port=12000\n")
+            self.assertEqual(snapshot.restore(run, 1), {"addrs": ["a"]})
+            self.assertEqual(self.read(os.path.join(run, "node0", "bitcoin.conf")), "port=12000\n")
+            self.assertEqual(self.read(os.path.join(run, "node0", "regtest", "wallet.dat")), "keys")
+            self.assertFalse(os.path.exists(os.path.join(run, "node0", "regtest", "debug.log")))
+            # the datadirs must be initialized first
+            self.assertRaises(AssertionError, snapshot.restore, os.path.join(folder, "empty"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,8 +6,16 @@ import logging
 import os
 import sys
 import signal
+import random
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 global reporter
 import pdb
+from cashaddress.cache import LRUCache
+from cashaddress import convert
+from test_framework.script import CScript
+from interopRpc import batchCall, proxyBatch, RPC_METHOD_NOT_FOUND
 
 #clientDirs = ["bucash", "abc", "xt", "hub"]
 #clientSubvers = set(["Bitcoin ABC", "Flowee the Hub", "Bitcoin XT", "BUCash"])
@@ -17,9 +25,74 @@ clientSubvers = set(["Bitcoin ABC", "Bitcoin XT", "BUCash"])
 #clientDirs = ["bucash", "bucash", "bucash", "bucash"]
 #clientSubvers = set(["BUCash"])
 
+# number of addresses legacyAddresses verifies against every client in cross check mode
+ADDRESS_CROSS_CHECK_SAMPLE = 10
+
+# number of (address, network, script kind) entries kept by scriptCache
+SCRIPT_CACHE_SIZE = 4096
+scriptCache = LRUCache(SCRIPT_CACHE_SIZE)
+
+# placeholder marking where ScriptTemplate splices in the hash160
+HASH160_HOLE = b"\xff" * 20
+
+# first pause of waitUntil in seconds, every further pause is backoff times longer up to WAIT_MAX_DELAY
+WAIT_FIRST_DELAY = 0.002
+WAIT_MAX_DELAY = 0.5
+
+# seconds a block or transaction is given to propagate before a node is considered to refuse it,
+# the 2 second sleep the tests used before, which a slow relay (trickling, compact blocks) may need
+PROPAGATION_HOLD = 2.0
+
 class TestAssertionError(AssertionError):
     pass
 
+def waitUntil(predicate, deadline, backoff=2.0, what=None, first=WAIT_FIRST_DELAY):
+    """
+    Call predicate until it returns a true value, pausing a few milliseconds
+    at first and backoff times longer after every call
+    Input:
+        predicate : function without argument
+        deadline : seconds after which the wait fails
+        backoff : growth factor of the pause between two calls
+        what : description logged with the time the wait took
+    Return:
+        seconds the wait took
+    Raise:
+        AssertionError when the deadline passes first
+    """
+    start = time.time()
+    delay = first
+    while not predicate():
+        elapsed = time.time() - start
+        if elapsed > deadline:
+            raise AssertionError("%s not reached in %.1f seconds" % (what or "condition", deadline))
+        time.sleep(min(delay, WAIT_MAX_DELAY, max(deadline - elapsed, 0) + first))
+        delay *= backoff
+    elapsed = time.time() - start
+    if what:
+        logging.info("waited %.3f s for %s" % (elapsed, what))
+    return elapsed
+
+def assert_never(predicate, duration=PROPAGATION_HOLD, backoff=2.0, what=None, first=WAIT_FIRST_DELAY):
+    """
+    Check that predicate stays false for duration seconds, eg. that a node keeps
+    refusing a block. Fails as soon as predicate returns a true value.
+    Return:
+        seconds the check took
+    """
+    start = time.time()
+    delay = first
+    while True:
+        assert not predicate(), "%s happened after %.3f seconds" % (what or "condition", time.time() - start)
+        elapsed = time.time() - start
+        if elapsed >= duration:
+            break
+        time.sleep(min(delay, WAIT_MAX_DELAY, duration - elapsed))
+        delay *= backoff
+    if what:
+        logging.info("%s did not happen in %.3f s" % (what, elapsed))
+    return elapsed
+
 def subverParseClient(s):
     """return the client name given a subversion string"""
     return s[1:].split(":")[0]
@@ -27,11 +100,11 @@ def subverParseClient(s):
 
 def verifyInterconnect(nodes, clientTypes=clientSubvers):
     """ Verify that every passed node is interconnected with all the other clients"""
-    for n in nodes:
+    group = NodeGroup(nodes)
+    for info, pi in zip(group.getnetworkinfo(), group.getpeerinfo()):
         connectedTo = set()
-        myclient = subverParseClient(n.getnetworkinfo()["subversion"])
+        myclient = subverParseClient(info["subversion"])
 
-        pi = n.getpeerinfo()
         for p in pi:
             connectedTo.add(subverParseClient(p["subver"]))
         notConnectedTo = clientTypes - connectedTo
@@ -40,6 +113,213 @@ def verifyInterconnect(nodes, clientTypes=clientSubvers):
             print("Client %s is not connected to %s" % (myclient, str(notConnectedTo)))
         assert(len(notConnectedTo) == 0)
 
+def cachedScript(kind, regtest=1, cache=None):
+    """
+    Decorator memoizing an output script generator that takes a single address.
+    Results are stored in scriptCache (or the given LRUCache) keyed by
+    (address, network, kind), so the same handful of addresses used for every
+    transaction output are only decoded and turned into a CScript once.
+    Input:
+        kind : name of the script, must be unique for each generator
+        regtest : network the addresses belong to
+        cache : LRUCache to use instead of the shared scriptCache
+    """
+    network = "regtest" if regtest else "mainnet"
+    def cache_decorator(func):
+        @functools.wraps(func)
+        def inner(btcAddress):
+            c = scriptCache if cache is None else cache
+            return c.lookup((btcAddress, network, kind), lambda: func(btcAddress))
+        return inner
+    return cache_decorator
+
+class ScriptTemplate(object):
+    """
+    Output script serialized once with a hole for a 20 byte hash160. Making a
+    script only joins the constant bytes before and after the hole with the
+    hash, the pushes and opcodes around it are never rebuilt. Nothing is
+    shared between two calls, so the threads of forEachNode can use the same
+    template.
+
+    Usages:
+
+    P2PKH_TEMPLATE = ScriptTemplate([OP_DUP, OP_HASH160, HASH160_HOLE, OP_EQUALVERIFY, OP_CHECKSIG])
+    script = P2PKH_TEMPLATE(bitcoinAddress2bin(btcAddress))
+    """
+    def __init__(self, elements):
+        """
+        Input:
+            elements : CScript elements, HASH160_HOLE where the hash goes
+        """
+        script = bytes(CScript(elements))
+        offset = script.rfind(HASH160_HOLE)
+        assert offset >= 0, "script template without HASH160_HOLE"
+        self.prefix = script[:offset]
+        self.suffix = script[offset + len(HASH160_HOLE):]
+
+    def __len__(self):
+        return len(self.prefix) + len(HASH160_HOLE) + len(self.suffix)
+
+    def __call__(self, hash160):
+        assert len(hash160) == len(HASH160_HOLE)
+        return CScript(b"".join((self.prefix, hash160, self.suffix)))
+
+@cachedScript("bin")
+def bitcoinAddress2bin(btcAddress):
+    """convert a regtest cash or legacy address to the 20 byte hash160 to be put in a CScript"""
+    return convert.to_hash160(btcAddress, 1)
+
+def legacyAddresses(nodes, addrs, crossCheck=False, sampleSize=ADDRESS_CROSS_CHECK_SAMPLE):
+    """
+    Convert regtest addresses to the legacy format locally, no RPC involved.
+    In cross check mode a random sample is also converted by every client with
+    getaddressforms, sent as a single batch per client, and any divergence
+    between our encoder and a client's fails the test.
+    Input:
+        nodes : clients to cross check against, in the order they were started
+        addrs : cash or legacy addresses
+        crossCheck : verify the sample against the clients
+        sampleSize : number of addresses to verify
+    Return:
+        legacy addresses in the same order as addrs
+    """
+    legacy = convert.to_legacy_addresses(addrs, 1)
+    if crossCheck:
+        sample = random.sample(range(len(addrs)), min(sampleSize, len(addrs)))
+        for nodeId, n in enumerate(nodes):
+            replies = batchCall(nodeId, [("getaddressforms", addrs[i]) for i in sample])
+            for i, (result, error) in zip(sample, replies):
+                if error and error["code"] == RPC_METHOD_NOT_FOUND:
+                    logging.info("%s has no getaddressforms, address cross check skipped" % getattr(n, "clientName", nodeId))
+                    break
+                assert error is None, "getaddressforms %s failed: %s" % (addrs[i], error)
+                assert result["legacy"] == legacy[i], "node %d converts %s to %s, we made %s" % (nodeId, addrs[i], result["legacy"], legacy[i])
+    return legacy
+
+class MempoolTracker(object):
+    """
+    Keep track of the transactions sent to a node and check in bulk that they
+    reached its mempool, instead of fetching the whole getrawmempool after
+    every sendrawtransaction.
+
+    Usages:
+
+    tracker = MempoolTracker(node)
+    tracker.submitted(txid, error)  # error of the sendrawtransaction reply or None
+    missing = tracker.confirm()
+    """
+    def __init__(self, node):
+        self.node = node
+        self.pending = []
+        self.accepted = set()
+        # txid -> reason the transaction is not in the mempool
+        self.rejected = {}
+        self.hasMempoolEntry = True
+
+    def submitted(self, txid, error=None):
+        """record a sent transaction with the JSON-RPC error the node replied, if any"""
+        if error is None:
+            self.pending.append(txid)
+        else:
+            self.rejected[txid] = error["message"]
+
+    def confirm(self):
+        """
+        Check which of the transactions accepted by sendrawtransaction since
+        the last call are in the mempool, with one batch of getmempoolentry.
+        Clients without getmempoolentry are checked against a single
+        getrawmempool instead.
+        Return:
+            dict txid -> reason of the accepted transactions missing from the mempool
+        """
+        pending = self.pending
+        self.pending = []
+        missing = {}
+        if not pending:
+            return missing
+        replies = None
+        if self.hasMempoolEntry:
+            batch = proxyBatch(self.node)
+            for txid in pending:
+                batch.add("getmempoolentry", txid)
+            replies = batch.execute()
+            if replies[0][1] and replies[0][1]["code"] == RPC_METHOD_NOT_FOUND:
+                self.hasMempoolEntry = False
+                replies = None
+        if replies is None:
+            mempool = set(self.node.getrawmempool())
+            replies = [(True, None) if txid in mempool else (None, {"message": "not in getrawmempool"}) for txid in pending]
+        for txid, (result, error) in zip(pending, replies):
+            if error is None:
+                self.accepted.add(txid)
+            else:
+                missing[txid] = "accepted by sendrawtransaction but missing from the mempool: %s" % error["message"]
+        self.rejected.update(missing)
+        return missing
+
+def forEachNode(nodes, work, *args):
+    """
+    Run work for every node at the same time, one thread per node. A thread
+    only talks to its own node, so each node keeps using its single RPC
+    connection and the total time is the one of the slowest node.
+    Input:
+        nodes : clients
+        work : function called as work(node, arg0[i], arg1[i]...) for node i
+        args : lists holding the value of each argument for every node
+    Return:
+        list of (result, exception or None, seconds) in node order
+    """
+    def run(i):
+        start = time.time()
+        try:
+            return (work(nodes[i], *[arg[i] for arg in args]), None, time.time() - start)
+        except Exception as e:
+            return (None, e, time.time() - start)
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        return list(executor.map(run, range(len(nodes))))
+
+def raiseNodeErrors(results):
+    """fail with the error of every node whose forEachNode work raised"""
+    errors = ["node %d: %s" % (i, repr(error))
+              for i, (result, error, seconds) in enumerate(results) if error is not None]
+    if errors:
+        raise AssertionError("; ".join(errors))
+
+class NodeGroup(object):
+    """
+    Send the same RPC to every node at the same time, so that looking at all
+    the nodes costs the latency of the slowest one instead of the sum.
+
+    group = NodeGroup(self.nodes)
+    group.getblockcount()  # [height of node 0, height of node 1...]
+    group.call("getblockcount")  # [(result, exception or None, seconds)...]
+    """
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return NodeGroup(self.nodes[index])
+        return self.nodes[index]
+
+    def call(self, method, *args):
+        """per node (result, exception or None, seconds) of method(*args), in node order"""
+        return forEachNode(self.nodes, lambda node: getattr(node, method)(*args))
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        def rpc(*args):
+            results = self.call(method, *args)
+            for result, error, seconds in results:
+                if error is not None:
+                    raise error  # same error the first failing node gives when called in turn
+            return [result for result, error, seconds in results]
+        return rpc
+
 def kill_running_process(appName="bitcoind"):
     """ Clean up system to start without previously leftover bitcoind """
     for line in os.popen("ps ax | grep " + appName + " | grep -v grep"):
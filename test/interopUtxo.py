@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 The Bitcoin Unlimited developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""
+    Harness side pool of the spendable outputs of a node wallet.
+
+    The wallet is fetched with listunspent once. Afterwards the pool follows
+    the wallet with listsinceblock, which only returns the transactions since
+    the last sync: outputs of the transactions sent by the harness and of the
+    mined blocks, coinbases being held back until they are mature. Outputs are
+    handed out largest first from a heap.
+
+    A coin handed out by pop() is considered spent. Give it back with restore()
+    when its transaction was never submitted, and hand it to quarantine() when
+    its transaction was rejected: such a coin is not handed out again until the
+    next reload(). Coins spent by the node wallet itself (sendtoaddress,
+    sendmany...) are not seen by the pool, call reload() after using those RPCs.
+
+    The coinbases are P2PK outputs, their real scriptPubKey is fetched with
+    gettxout rather than derived from the address listsinceblock gives.
+
+    A coin the harness adds itself (the outputs of a fan-out) is unconfirmed
+    until a sync sees its transaction in a block. The coins are kept in one
+    heap per script kind and confirmation state, so pop(kinds=[P2PKH],
+    confirmedOnly=True) hands out the largest confirmed P2PKH coin in
+    O(log n) without going through the larger P2PK coinbases.
+
+    Usages:
+
+    pool = nodeUtxoPool(node)
+    pool.sync()
+    utxo = pool.pop()  # same fields as a listunspent entry
+
+    # grow the wallet by 3000 coins paying to addrs
+    fanOutUtxos(node, addrs, 3000)
+
+    # the same on several nodes at once, mining from a single one
+    fans = [FanOut(node, addrs[i], 3000) for i, node in enumerate(nodes)]
+    while not all(fan.done() for fan in fans):
+        forEachNode(nodes, lambda node, fan: fan.done() or fan.step(), fans)
+        ...  # sync the mempools, mine a block on one node, sync the blocks
+        for fan in fans:
+            fan.confirmed()
+"""
+import decimal
+import heapq
+import itertools
+import math
+from binascii import hexlify, unhexlify
+from test_framework.mininode import CTransaction, CTxIn, CTxOut, COutPoint, COIN
+from test_framework.script import CScript
+from cashaddress import convert
+from interopSigner import nodeSigner, p2pkhHash, p2pkKey
+from interopRpc import proxyBatch, replyResult
+
+# kinds of output scripts, see scriptKind
+P2PKH = "p2pkh"
+P2PK = "p2pk"
+OTHER_SCRIPT = "other"
+
+# depth a coinbase needs before it can be spent
+COINBASE_MATURITY = 100
+
+# outputs of every fan-out transaction
+FANOUT = 100
+# default -limitdescendantcount of the clients, an unconfirmed transaction and
+# its unconfirmed descendants can not be more than this in the mempool
+MEMPOOL_DESCENDANTS = 25
+# smallest output the clients relay, in satoshis
+DUST_LIMIT = 546
+# fan-out transactions sent to the node in a single JSON-RPC batch request
+FANOUT_SUBMIT_BATCH = 100
+
+def p2pkhScript(address):
+    """hex scriptPubKey paying to a P2PKH regtest address"""
+    return "76a914" + convert.to_hash160(address, 1).hex() + "88ac"
+
+def scriptKind(scriptHex):
+    """P2PKH, P2PK or OTHER_SCRIPT kind of a hex output script"""
+    script = unhexlify(scriptHex)
+    if p2pkhHash(script) is not None:
+        return P2PKH
+    if p2pkKey(script) is not None:
+        return P2PK
+    return OTHER_SCRIPT
+
+class UtxoPool(object):
+    def __init__(self, node):
+        """
+        Input:
+            node : client whose wallet owns the outputs
+        """
+        self.node = node
+        # (script kind, confirmed) -> heap of (-amount, sequence, utxo), so that
+        # asking for one kind or for confirmed coins never pops the other coins
+        self.heaps = {}
+        self.seq = itertools.count()
+        # every outpoint ever added, spent or not, so a sync never adds a coin twice
+        self.known = set()
+        # outpoint -> (height at which the coinbase matures, utxo)
+        self.immature = {}
+        # outpoint -> why the transaction spending the coin was rejected
+        self.quarantined = {}
+        # txids of the coins added while their transaction was in no block
+        self.unconfirmed = set()
+        self.lastBlock = None
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.heaps.values())
+
+    def load(self):
+        """forget everything and fetch the whole wallet with listunspent"""
+        self.lastBlock = self.node.getbestblockhash()
+        self.heaps = {}
+        self.known = set()
+        self.immature = {}
+        self.quarantined = {}
+        self.unconfirmed = set()
+        # listunspent only lists the coins of at least one confirmation by default
+        for utxo in self.node.listunspent():
+            self.add(utxo, True)
+
+    reload = load
+
+    def push(self, utxo):
+        key = (scriptKind(utxo["scriptPubKey"]), self.confirmed(utxo))
+        heapq.heappush(self.heaps.setdefault(key, []), (-utxo["amount"], next(self.seq), utxo))
+
+    def add(self, utxo, confirmed=False):
+        """
+        add an output with at least the txid, vout, amount, address and scriptPubKey fields of listunspent
+        Input:
+            confirmed : True when the transaction of the output is already in a block
+        """
+        outpoint = (utxo["txid"], utxo["vout"])
+        if outpoint in self.known:
+            return
+        self.known.add(outpoint)
+        if not confirmed:
+            self.unconfirmed.add(utxo["txid"])
+        self.push(utxo)
+
+    def spent(self, utxo):
+        """record a coin the harness made and spent itself, so that sync does not add it"""
+        self.known.add((utxo["txid"], utxo["vout"]))
+
+    def restore(self, utxo):
+        """give back a coin returned by pop() whose transaction was never submitted"""
+        self.push(utxo)
+
+    def confirmed(self, utxo):
+        """True when the transaction of a coin was seen in a block by the last sync"""
+        return utxo["txid"] not in self.unconfirmed
+
+    def quarantine(self, utxo, reason):
+        """set aside a coin returned by pop() whose transaction was rejected, until the next reload"""
+        self.quarantined[(utxo["txid"], utxo["vout"])] = reason
+
+    def pop(self, accept=None, kinds=None, confirmedOnly=False):
+        """
+        largest coin of the pool, which is from now on considered spent
+        Input:
+            accept : function telling if a coin may be handed out, the others
+                     stay in the pool but are popped and pushed back on every call
+            kinds : script kinds handed out (eg. [P2PKH]), any kind by default
+            confirmedOnly : only hand out the coins seen in a block by the last sync
+        """
+        heaps = [heap for (kind, confirmed), heap in self.heaps.items()
+                 if (kinds is None or kind in kinds) and (confirmed or not confirmedOnly)]
+        skipped = []
+        try:
+            while True:
+                # the heap topped by the largest coin, IndexError when they are all empty
+                heap = min((heap for heap in heaps if heap), key=lambda heap: heap[0], default=[])
+                entry = heapq.heappop(heap)
+                if accept is None or accept(entry[2]):
+                    return entry[2]
+                skipped.append((heap, entry))
+        finally:
+            for heap, entry in skipped:
+                heapq.heappush(heap, entry)
+
+    def sync(self):
+        """add the wallet outputs made since the last sync, the first sync loads the wallet"""
+        if self.lastBlock is None:
+            self.load()
+            return
+        since = self.node.listsinceblock(self.lastBlock)
+        self.lastBlock = since["lastblock"]
+        height = self.node.getblockcount()
+        for tx in since["transactions"]:
+            if tx.get("confirmations", 0) > 0:
+                self.unconfirmed.discard(tx["txid"])
+            outpoint = (tx["txid"], tx["vout"])
+            if outpoint in self.known or outpoint in self.immature:
+                continue
+            if tx["category"] not in ("receive", "generate", "immature"):
+                continue
+            if tx["category"] == "receive":
+                script = p2pkhScript(tx["address"])
+            else:
+                # a coinbase pays to P2PK, its address is the one of the key
+                txout = self.node.gettxout(tx["txid"], tx["vout"])
+                if txout is None:
+                    continue  # already spent by the node wallet
+                script = txout["scriptPubKey"]["hex"]
+            utxo = {"txid": tx["txid"], "vout": tx["vout"], "address": tx["address"],
+                    "amount": tx["amount"], "scriptPubKey": script}
+            if tx["category"] == "immature":
+                mined = height - tx["confirmations"] + 1
+                self.immature[outpoint] = (mined + COINBASE_MATURITY, utxo)
+            else:
+                self.add(utxo, tx.get("confirmations", 0) > 0)
+        for outpoint, (mature, utxo) in list(self.immature.items()):
+            if height >= mature:
+                del self.immature[outpoint]
+                self.add(utxo, True)
+        # move the coins whose transaction got in a block to the heaps of confirmed coins
+        for (kind, confirmed), heap in list(self.heaps.items()):
+            if not confirmed and any(utxo["txid"] not in self.unconfirmed for _, _, utxo in heap):
+                self.heaps[(kind, confirmed)] = []
+                for _, _, utxo in heap:
+                    self.push(utxo)
+
+pools = {}
+
+def nodeUtxoPool(node):
+    """UtxoPool of a node, kept for the whole test"""
+    pool = pools.get(node)
+    if pool is None:
+        pool = UtxoPool(node)
+        pools[node] = pool
+    return pool
+
+def fanOutTx(coin, addrs, first, outputs, feeRate):
+    """
+    Unsigned transaction splitting coin in outputs coins paying to addrs from index first
+    Return:
+        raw transaction hex and the new coins without their txid
+    """
+    tx = CTransaction()
+    tx.vin.append(CTxIn(COutPoint(int(coin["txid"], 16), coin["vout"]), b"", 0xffffffff))
+    # P2PKH input and outputs, fee at twice the relay fee
+    fee = int(math.ceil(feeRate * (10 + 148 + 34 * outputs) / 1000.0)) * 2
+    # never make dust, a small coin is split in fewer outputs
+    outputs = max(1, min(outputs, (int(coin["amount"] * COIN) - fee) // DUST_LIMIT))
+    value = (int(coin["amount"] * COIN) - fee) // outputs
+    coins = []
+    for x in range(outputs):
+        address = addrs[(first + x) % len(addrs)]
+        script = p2pkhScript(address)
+        tx.vout.append(CTxOut(value, CScript(unhexlify(script))))
+        coins.append({"vout": x, "address": address, "amount": decimal.Decimal(value) / COIN, "scriptPubKey": script})
+    return hexlify(tx.serialize()).decode("utf-8"), coins
+
+class FanOut(object):
+    """
+    Create at least amt new coins paying to addrs in O(log amt) generations.
+    Every generation splits each coin made by the previous one in up to
+    fanout coins. The transactions of a generation are signed in bulk by the
+    LocalSigner and sent in JSON-RPC batches. A generation can be chained on
+    the unconfirmed previous ones as long as the mempool descendant limit
+    allows, otherwise the caller mines a block and calls confirmed(). The
+    FanOut never mines itself, so the FanOuts of several nodes can step at
+    the same time while a single node mines between the generations.
+    """
+    def __init__(self, node, addrs, amt, fanout=FANOUT, batchSize=FANOUT_SUBMIT_BATCH):
+        """
+        Input:
+            node : client whose wallet funds and receives the coins
+            addrs : addresses of the node wallet to pay
+            amt : number of coins to create
+            fanout : outputs of every transaction
+            batchSize : number of transactions sent in one JSON-RPC batch request
+        """
+        self.node = node
+        self.addrs = addrs
+        self.amt = amt
+        self.fanout = fanout
+        self.batchSize = batchSize
+        self.pool = nodeUtxoPool(node)
+        self.pool.sync()
+        self.signer = nodeSigner(node)
+        self.feeRate = int(node.getnetworkinfo()["relayfee"] * COIN)  # satoshis per kB
+        self.coins = [self.pool.pop()]
+        # fanouts of the generations still in the mempool
+        self.unconfirmed = []
+        self.first = 0
+
+    def done(self):
+        return len(self.coins) >= self.amt
+
+    def chainable(self):
+        """True when the next generation fits in the mempool descendant limit of the oldest unconfirmed one"""
+        descendants = 0
+        product = 1
+        for f in self.unconfirmed:
+            product *= f
+            descendants += product
+        return descendants + 1 <= MEMPOOL_DESCENDANTS
+
+    def confirmed(self):
+        """note that a block mined every generation sent so far"""
+        self.unconfirmed = []
+
+    def submit(self, signed):
+        """send the signed (transaction hex, txid) of a generation to the node"""
+        for start in range(0, len(signed), self.batchSize):
+            batch = proxyBatch(self.node)
+            for txn_hex, txn_id in signed[start:start + self.batchSize]:
+                batch.add("sendrawtransaction", txn_hex)
+            for reply in batch.execute():
+                replyResult(reply)
+
+    def step(self):
+        """build, sign and send the next generation, return its number of new coins"""
+        assert self.chainable(), "mine a block before the next generation"
+        if len(self.coins) * self.fanout >= self.amt:
+            outputs = -(-self.amt // len(self.coins))  # last generation, just enough coins
+        else:
+            outputs = self.fanout
+        txns = []
+        for coin in self.coins:
+            raw, made = fanOutTx(coin, self.addrs, self.first, outputs, self.feeRate)
+            self.first += outputs
+            txns.append((raw, [coin], made))
+        signed = self.signer.sign([(raw, spent) for raw, spent, made in txns])
+        nextCoins = []
+        for (txn_hex, txn_id), (raw, spent, made) in zip(signed, txns):
+            for coin in made:
+                coin["txid"] = txn_id
+                nextCoins.append(coin)
+        self.submit(signed)
+        for coin in self.coins:
+            self.pool.spent(coin)
+        assert len(nextCoins) > len(self.coins), "coins too small to be split any further"
+        self.unconfirmed.append(outputs)
+        self.coins = nextCoins
+        return len(nextCoins)
+
+    def finish(self):
+        """
+        Return:
+            the new coins, also added to the node UtxoPool
+        """
+        for coin in self.coins:
+            self.pool.add(coin)
+        return self.coins
+
+def fanOutUtxos(node, addrs, amt, fanout=FANOUT, batchSize=FANOUT_SUBMIT_BATCH):
+    """
+    Create at least amt new coins paying to addrs with a FanOut, mining a
+    block on node whenever the mempool descendant limit is reached. Only
+    call it for a single node at a time, see FanOut to fan out on every node.
+    Return:
+        the new coins, also added to the node UtxoPool
+    """
+    fan = FanOut(node, addrs, amt, fanout, batchSize)
+    while not fan.done():
+        if not fan.chainable():
+            node.generate(1)
+            fan.confirmed()
+        fan.step()
+    return fan.finish()
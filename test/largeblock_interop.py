@@ -21,14 +21,18 @@ from test_framework.script import *
 from test_framework.blocktools import *
 from test_framework.bunode import *
 import test_framework.script as script
-from test_framework.mininode import COIN
+from test_framework.mininode import COIN, CTransaction, FromHex
 
 from interopUtils import *
+from interopSigner import nodeSigner, closeSigners
+from interopPlanner import planTransactions, plannedTxSizes, varIntSize
+from interopUtxo import nodeUtxoPool, fanOutUtxos, FanOut, P2PKH
+from interopSnapshot import ChainSnapshot
+from interopRpc import proxyBatch, replyResult
+from interopSync import SyncWaiter, zmqArgs
+from interopLatency import PropagationRecorder
 # helpers for converting legacy BCH address to new format
-try:
-    from cashaddress import convert
-except ImportError:
-    raise ImportError("\nPlease download and pip3 install package base58-0.2.5-py3-none-any.whl (see steps from cachaddress/convert.py)")
+from cashaddress import convert
 
 if sys.version_info[0] < 3:
     raise "Use Python 3"
@@ -61,49 +65,52 @@ SIZE_31_MB = 31000000
 SIZE_32_MB = 32000000
 
 REGTEST_PREFIX = 'bchreg:'
-B58_DIGITS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
-
-def bitcoinAddress2bin(btcAddress):
-    """convert a bitcoin address to binary data capable of being put in a CScript"""
-    #print("btcAddress = ", btcAddress)
-    legacyAddressBytes = b''
-    # btcAddress contains prefix
-    if convert.is_valid(btcAddress):
-        # 2nd argument "1" is included for regtest; otherwise, omit the second argument
-        legacyAddressBytes = convert.to_legacy_address(btcAddress, 1).encode()
-    else:
-        assert(0)  # should not arrive here
-    return legacyAddressBytes
-
-def decodeBase58(s):
-    """Decode a base58-encoding string, returning bytes"""
-    if not s:
-        return b''
-
-    # Convert the string to an integer
-    n = 0
-    for c in s:
-        n *= 58
-        if c not in B58_DIGITS:
-            raise InvalidBase58Error('Character %r is not a valid base58 character' % c)
-        digit = B58_DIGITS.index(c)
-        n += digit
-
-    # Convert the integer to bytes
-    h = '%x' % n
-    if len(h) % 2:
-        h = '0' + h
-    res = binascii.unhexlify(h.encode('utf8'))
-
-    # Add padding back.
-    pad = 0
-    for c in s[:-1]:
-        if c == B58_DIGITS[0]:
-            pad += 1
-        else:
-            break
-    return b'\x00' * pad + res
 
+# transactions prioritised and sent to the node in a single JSON-RPC batch request
+TX_SUBMIT_BATCH = 100
+
+# addresses made on every node and UTXOs created for them during the setup
+NUM_ADDRS = 50
+SETUP_UTXOS = [3000, 3000 * 2, 3000, 3000]
+# what the setup builds, part of the key of its chain snapshot
+SETUP_SHAPE = {"addrs": NUM_ADDRS, "generate": 5, "utxos": SETUP_UTXOS}
+
+# seconds the nodes are given to agree on blocks and mempools of up to 32MB
+LARGE_SYNC_TIMEOUT = 10 * 60
+
+# version bits header of the blocks built by assembleBlock
+ASSEMBLED_BLOCK_VERSION = 0x20000000
+
+# wasteful outputs of a full transaction and the length of their output script,
+# as long as the junk of ITERATIONS_PER_100K SCRIPT_WORDS so that a full
+# transaction is about 100KB
+WASTEFUL_OUTPUTS = 8
+WASTEFUL_SCRIPT_SIZE = len(SCRIPT_WORDS) * ITERATIONS_PER_100K
+
+wastefulTemplates = {}
+
+def wastefulTemplate(padding):
+    """ScriptTemplate of a wasteful output script with padding bytes of junk data, built once per length"""
+    template = wastefulTemplates.get(padding)
+    if template is None:
+        template = ScriptTemplate([(SCRIPT_WORDS * ITERATIONS_PER_100K)[:padding], OP_DROP,
+                                   OP_DUP, OP_HASH160, HASH160_HOLE, OP_EQUALVERIFY, OP_CHECKSIG])
+        wastefulTemplates[padding] = template
+    return template
+
+def wastefulScriptSize(padding):
+    return len(wastefulTemplate(padding))
+
+# junk data length of a full wasteful output: the script size less the push
+# opcodes, the OP_DROP and the P2PKH part holding the 20 byte hash160, measured
+# on a template whose junk is pushed with OP_PUSHDATA2 like the full one
+WASTEFUL_PADDING = WASTEFUL_SCRIPT_SIZE - (wastefulScriptSize(0x100) - 0x100)
+assert wastefulScriptSize(WASTEFUL_PADDING) == WASTEFUL_SCRIPT_SIZE
+
+WASTEFUL_TEMPLATE = wastefulTemplate(WASTEFUL_PADDING)
+P2PKH_TEMPLATE = ScriptTemplate([OP_DUP, OP_HASH160, HASH160_HOLE, OP_EQUALVERIFY, OP_CHECKSIG])
+
+@cachedScript("wasteful100k")
 def wastefulOutput(btcAddress):
     """ 
     Create useless data for the CScript. Txn block size of about 100KB
@@ -114,21 +121,12 @@ def wastefulOutput(btcAddress):
         CScript with useless data
     Warning: Creates outputs that can't be spent by bitcoind
     """
-    data = b""
-    for _ in range(ITERATIONS_PER_100K):
-        data += SCRIPT_WORDS
-    #logging.info("> Length of Junk data : %d" % len(data))
-    
-    # trim 31 chars due to extra agruments inputs to CScript  
-    # len(bitcoinAddress2bin(btcAddress))) = 20 and the others addd up to be 11
-    data = data[:-65]
-    ret = CScript([data, OP_DROP, OP_DUP, OP_HASH160, bitcoinAddress2bin(btcAddress), OP_EQUALVERIFY, OP_CHECKSIG])
-    return ret
+    return WASTEFUL_TEMPLATE(bitcoinAddress2bin(btcAddress))
 
+@cachedScript("p2pkh")
 def p2pkh(btcAddress):
     """ create a pay-to-public-key-hash script"""
-    ret = CScript([OP_DUP, OP_HASH160, bitcoinAddress2bin(btcAddress), OP_EQUALVERIFY, OP_CHECKSIG])
-    return ret
+    return P2PKH_TEMPLATE(bitcoinAddress2bin(btcAddress))
 
 def createrawtransaction(inputs, outputs, outScriptGenerator=p2pkh):
     """
@@ -161,7 +159,69 @@ def createrawtransaction(inputs, outputs, outScriptGenerator=p2pkh):
     tx.rehash()
     return hexlify(tx.serialize()).decode("utf-8")
 
-def generateTx(node, txBytes, addrs, data=None):
+def dataScriptLens(data):
+    """script lengths of the extra outputs paying to data, see planTransactions"""
+    return [len(CScript([OP_RETURN, unhexlify(data)]))] if data else []
+
+def planWasteful(txBytes, data=None):
+    """plan of the wasteful transactions of about txBytes in total, see planTransactions"""
+    return planTransactions(txBytes, WASTEFUL_OUTPUTS, WASTEFUL_PADDING, wastefulScriptSize, dataScriptLens(data))
+
+def planBlock(blockBytes, coinbaseSize, data=None):
+    """
+    plan of the wasteful transactions filling a block of about blockBytes
+    with its header, transaction count and coinbase
+    """
+    # the transaction count is 1 byte long up to 252 transactions and 3 bytes above
+    countSize = 1
+    while True:
+        plan = planWasteful(blockBytes - 80 - countSize - coinbaseSize, data)
+        if varIntSize(len(plan) + 1) <= countSize:
+            return plan
+        countSize = varIntSize(len(plan) + 1)
+
+def signTransactions(node, wallet, plan, addrs, data=None, confirmedOnly=False):
+    """
+    Build and sign locally the planned transactions that fill a large block,
+    spending the largest coins of the wallet UtxoPool
+
+    Input:
+        node : client object
+        wallet : UtxoPool of the node
+        plan : (outputs, padding) of every transaction, see planWasteful
+        addrs : list of addresses from getnewaddress() for the node
+        data : one of the CTxout to be created if it's available from the input (eg. TX_DATA is used)
+        confirmedOnly : only spend coins already in a block, for a block that does not hold their parents
+    Return:
+        list of (signed transaction hex, txid), and dict txid -> coins spent by the transaction
+    """
+    signer = nodeSigner(node)
+    decContext = decimal.getcontext().prec
+    decimal.getcontext().prec = 8 + 8  # 8 digits to get to 21million, and each bitcoin is 100 million satoshis
+    txns = []
+    count = 0
+    for outputs, padding in plan:
+        count += 1
+        # the plan is made for P2PKH inputs, a P2PK coinbase input is shorter
+        utxo = wallet.pop(kinds=[P2PKH], confirmedOnly=confirmedOnly)
+        outp = {}
+        # Make the tx bigger by adding addtl outputs so it validates faster
+        payment = satoshi_round(utxo["amount"] / decimal.Decimal(outputs))
+        for x in range(0, outputs):
+            outp[addrs[(count + x) % len(addrs)]] = payment
+        if data:
+            outp["data"] = data
+        if padding == WASTEFUL_PADDING:
+            outScript = wastefulOutput
+        else:
+            outScript = lambda addr, template=wastefulTemplate(padding): template(bitcoinAddress2bin(addr))
+        txns.append((createrawtransaction([utxo], outp, outScript), [utxo]))
+    decimal.getcontext().prec = decContext
+    signed = signer.sign(txns, plannedTxSizes(plan, wastefulScriptSize, dataScriptLens(data)))
+    spent = {txn_id: utxos for (txn_hex, txn_id), (raw_txn, utxos) in zip(signed, txns)}
+    return signed, spent
+
+def generateTx(node, txBytes, addrs, data=None, batchSize=TX_SUBMIT_BATCH):
     """
     Create many transactions to fill up the required blockchain block size of MBs 
     (from 1Mb to 32MB)
@@ -171,11 +231,13 @@ def generateTx(node, txBytes, addrs, data=None):
         txBytes : number of bytes for the mined block with many transactions each is around 250KB
         addrs : list of addresses from getnewaddress() for the node
         data : one of the CTxout to be created if it's available from the input (eg. TX_DATA is used)
+        batchSize : number of transactions submitted in one JSON-RPC batch request
     Return:
         number signed raw transactions, and number of bytes in total (which is close to txBytes specified)
+    Transactions are signed locally by the node's LocalSigner, see interopSigner.
     """
-    wallet = node.listunspent()
-    wallet.sort(key=lambda x: x["amount"], reverse=False)
+    wallet = nodeUtxoPool(node)
+    wallet.sync()
     logging.info("Wallet length is %d" % len(wallet))
     # parameters for using node.prioritisetransaction  <txid> <priority delta> <fee delta>
     relayfee = node.getnetworkinfo()['relayfee']
@@ -183,61 +245,70 @@ def generateTx(node, txBytes, addrs, data=None):
     fee_delta = int(relayfee * COIN*100000)
 
     size = 0
-    count = 0
-    decContext = decimal.getcontext().prec
-    decimal.getcontext().prec = 8 + 8  # 8 digits to get to 21million, and each bitcoin is 100 million satoshis
-    while size < txBytes:
-        count += 1
-        utxo = wallet.pop()
-        outp = {}
-        # Make the tx bigger by adding addtl outputs so it validates faster
-        payment = satoshi_round(utxo["amount"] / decimal.Decimal(8.0))
-        #print(">>>>> UTXO amount = ", utxo["amount"])
-        for x in range(0, 8):
-            outp[addrs[(count + x) % len(addrs)]] = payment
-        if data:
-            outp["data"] = data
-        raw_txn = createrawtransaction([utxo], outp, wastefulOutput)
-        txn_hex = node.signrawtransaction(raw_txn)["hex"]
-        txn_id = node.decoderawtransaction(txn_hex)["txid"]
-        size += len(binascii.unhexlify(txn_hex))  # add up
-        # Need to avoid "insufficient priority"
-        node.prioritisetransaction(txn_id, priority_delta, fee_delta)
-        try:
-            node.sendrawtransaction(txn_hex)
-            #logging.info("Assert that prioritised free transaction is accepted to mempool")
-            assert(txn_id in node.getrawmempool())
-        except (JSONRPCException) as e1:
-            logging.info(e1)
-            assert(txn_id not in node.getrawmempool())
+    tracker = MempoolTracker(node)
+    signed, spent = signTransactions(node, wallet, planWasteful(txBytes, data), addrs, data)
+    count = len(signed)
+    for start in range(0, len(signed), batchSize):
+        chunk = signed[start:start + batchSize]
+        batch = proxyBatch(node)
+        calls = []
+        for txn_hex, txn_id in chunk:
+            size += len(txn_hex) // 2
+            # Need to avoid "insufficient priority"
+            prioritised = batch.add("prioritisetransaction", txn_id, priority_delta, fee_delta)
+            calls.append((prioritised, batch.add("sendrawtransaction", txn_hex)))
+        replies = batch.execute()
+        for (txn_hex, txn_id), (prioritised, sent) in zip(chunk, calls):
+            replyResult(replies[prioritised])
+            tracker.submitted(txn_id, replies[sent][1])
+        missing = tracker.confirm()
+        assert not missing, missing
+    for txn_id, reason in tracker.rejected.items():
+        logging.info("%s rejected: %s" % (txn_id, reason))
+        for utxo in spent[txn_id]:
+            wallet.quarantine(utxo, reason)
     logging.info("%d tx %d length" % (count, size))
-    decimal.getcontext().prec = decContext
+    logging.info("script cache: %d hits %d misses" % (scriptCache.hits, scriptCache.misses))
     return (count, size)
 
-def mostly_sync_mempools(rpc_connections, difference=50, wait=1,verbose=1):
+def assembleBlock(node, blockBytes, addrs, data=None):
     """
-    Wait until everybody has the most of the same transactions in their memory
-    pools. There is no guarantee that mempools will ever sync due to the
-    filterInventoryKnown bloom filter.
+    Mine a block of about blockBytes on top of the tip of node without going
+    through its mempool. The transactions are signed locally, the block is
+    built with create_block, solved in the harness (regtest PoW) and given to
+    the node with submitblock, so only block validation and relay are tested.
+
+    Input:
+        node : client object
+        blockBytes : size of the block to mine
+        addrs : list of addresses from getnewaddress() for the node
+        data : one of the CTxout to be created if it's available from the input (eg. TX_DATA is used)
+    Return:
+        hash of the block and its size
     """
-    iterations = 0
-    while True:
-        iterations+=1
-        pool = set(rpc_connections[0].getrawmempool())
-        num_match = 1
-        poolLen = [len(pool)]
-        for i in range(1, len(rpc_connections)):
-            tmp = set(rpc_connections[i].getrawmempool())
-            if tmp == pool:
-                num_match = num_match+1
-            if iterations > 10 and len(tmp.symmetric_difference(pool)) < difference:
-                num_match = num_match+1
-            poolLen.append(len(tmp))
-        if verbose:
-            logging.info("sync mempool: " + str(poolLen))
-        if num_match == len(rpc_connections):
-            break
-        time.sleep(wait)
+    wallet = nodeUtxoPool(node)
+    wallet.sync()
+    tip = node.getblockheader(node.getbestblockhash())
+    coinbase = create_coinbase(tip["height"] + 1)
+    coinbase.rehash()
+    # the block does not hold the parents of the coins, only spend confirmed ones
+    plan = planBlock(blockBytes, len(coinbase.serialize()), data)
+    signed, spent = signTransactions(node, wallet, plan, addrs, data, confirmedOnly=True)
+    block = create_block(int(tip["hash"], 16), coinbase, tip["time"] + 1)
+    block.nVersion = ASSEMBLED_BLOCK_VERSION
+    for txn_hex, txn_id in signed:
+        block.vtx.append(FromHex(CTransaction(), txn_hex))
+    block.hashMerkleRoot = block.calc_merkle_root()
+    block.solve()
+    blockHex = hexlify(block.serialize()).decode("utf-8")
+    result = node.submitblock(blockHex)
+    if result is not None:
+        for utxos in spent.values():
+            for utxo in utxos:
+                wallet.quarantine(utxo, result)
+        raise AssertionError("submitblock rejected the assembled block: %s" % result)
+    logging.info("assembled block %s, %d tx %d length" % (block.hash, len(block.vtx), len(blockHex) // 2))
+    return block.hash, len(blockHex) // 2
 
 def get_bestblockhash(node, nodeId):
     best_blockhash = node.getbestblockhash()
@@ -436,9 +507,15 @@ def test_generate_largeblock(self, nodeId1, nodeId2, txBytes, addrs, data=TX_DAT
         Excessive block generated is thrown if MG > EB in settings
     """
     logging.info(">>> Entered : test_generate_largeblock \n")
+    if self.recorder:
+        self.recorder.mark("%d bytes" % txBytes)
     try:
-        count, size = generateTx(self.nodes[nodeId1], txBytes, addrs, data)
-        blkHash = self.nodes[nodeId1].generate(1)[0]
+        if self.assembleBlocks:
+            # build the block in the harness, the mempool is not involved
+            blkHash, size = assembleBlock(self.nodes[nodeId1], txBytes, addrs, data)
+        else:
+            count, size = generateTx(self.nodes[nodeId1], txBytes, addrs, data)
+            blkHash = self.nodes[nodeId1].generate(1)[0]
         blkInfo = self.nodes[nodeId1].getblock(blkHash)
         logging.info("> blkInfo[size] =  %d " %blkInfo["size"])
         assert(blkInfo["size"] >= txBytes)
@@ -448,8 +525,8 @@ def test_generate_largeblock(self, nodeId1, nodeId2, txBytes, addrs, data=TX_DAT
         mempool = self.nodes[nodeId1].getmempoolinfo()
         logging.info(">> Node 1 - mempool size : %d " %mempool["size"])
         block_size1 = get_bestblockhash(self.nodes[nodeId1], nodeId1)
-        #sync_blocks(self.nodes[0:3])
-        sync_blocks(self.nodes[0:2])
+        #self.waiter.syncBlocks(self.nodes[0:3])
+        self.waiter.syncBlocks(self.nodes[0:2])
         
         mempool = self.nodes[nodeId2].getmempoolinfo()
         logging.info(">> Node 0 - mempool size : %d " %mempool["size"])
@@ -549,9 +626,26 @@ class LargeBlkTest(BitcoinTestFramework):
         self.unspendableTx = 0
         self.bins = [ os.path.join(base_dir, x, self.buildVariant, "src","bitcoind") for x in clientDirs]
         logging.info(self.bins)
+        self.bitcoinConf = None
+        # mine the large blocks with assembleBlock instead of the mempool and generate
+        self.assembleBlocks = False
+        self.snapshot = None
+        self.snapshotMeta = None
+        self.waiter = None
+        # measure the block and transaction propagation between the clients
+        self.measureLatency = False
+        self.recorder = None
 
     def setup_network(self, split=False):
-        self.nodes = start_nodes(len(self.clientDirs), self.options.tmpdir,binary=self.bins, timewait=60*60)
+        restored = False
+        if self.snapshot is None:
+            # reuse the state built by the setup of an earlier run with the same binaries
+            self.snapshot = ChainSnapshot("largeblock", self.bins, self.bitcoinConf, SETUP_SHAPE)
+            self.snapshotMeta = self.snapshot.restore(self.options.tmpdir, len(self.clientDirs))
+            restored = self.snapshotMeta is not None
+        notify = zmqArgs(self.bins)
+        self.nodes = start_nodes(len(self.clientDirs), self.options.tmpdir, notify, binary=self.bins, timewait=60*60)
+        self.waiter = SyncWaiter(self.nodes, notify, LARGE_SYNC_TIMEOUT)
 
         # Connect each node to the other
         connect_nodes_bi(self.nodes,0,1)
@@ -563,34 +657,26 @@ class LargeBlkTest(BitcoinTestFramework):
 
         self.is_network_split=False
         self.sync_all()
+        if restored:
+            # the tip of an old snapshot puts the nodes in initial block download, see ChainSnapshot
+            self.nodes[0].generate(1)
+            self.sync_all()
 
-    def createUtxos(self, node, addrs, amt):
-        wallet = node.listunspent()
-        wallet.sort(key=lambda x: x["amount"], reverse=True)
+    def sync_all(self):
+        self.waiter.syncBlocks()
+        self.waiter.syncMempools()
 
+    def createUtxos(self, node, addrs, amt):
         # Create a LOT of UTXOs
         logging.info("Create lots of UTXOs...")
-        n = 0
-        group = min(100, amt)
-        count = 0
-        for w in wallet:
-            count += group
-            split_transaction(node, [w], addrs[n:group + n])
-            n += group
-            if n >= len(addrs):
-                n = 0
-            if count > amt:
-                break
+        fanOutUtxos(node, addrs, amt)
         logging.info("mine blocks")
         node.generate(1)  # mine all the created transactions
         logging.info("sync all blocks and mempools")
         self.sync_all()
 
-    def run_test(self):
-
-        #test_disconnect_bucash_node(self)
-        # Creating UTXOs needed for building tx for large blocks
-        NUM_ADDRS = 50
+    def setupUtxos(self):
+        """make the addresses and UTXOs the tests spend, then save the chain snapshot"""
         logging.info("Creating addresses...")
         self.nodes[0].keypoolrefill(NUM_ADDRS)
         self.nodes[1].keypoolrefill(NUM_ADDRS)
@@ -600,35 +686,74 @@ class LargeBlkTest(BitcoinTestFramework):
         self.addrs3 = [self.nodes[3].getnewaddress() for _ in range(NUM_ADDRS)]
         logging.info("creating utxos")
 
-        self.nodes[1].generate(5)
-        sync_blocks(self.nodes)
+        self.nodes[1].generate(SETUP_SHAPE["generate"])
+        self.waiter.syncBlocks()
 
-        self.createUtxos(self.nodes[0], self.addrs0, 3000)
-        for i in range(0,2):
-            self.createUtxos(self.nodes[1], self.addrs1, 3000)
-        self.createUtxos(self.nodes[2], self.addrs2, 3000)
-        self.createUtxos(self.nodes[3], self.addrs3, 3000)
-        sync_blocks(self.nodes)
+        # every node splits its own coins at the same time, a single node mines
+        # each generation so that the nodes never mine competing blocks
+        logging.info("Create lots of UTXOs...")
+        addrs = [self.addrs0, self.addrs1, self.addrs2, self.addrs3]
+        fans = [FanOut(node, addrs[i], SETUP_UTXOS[i]) for i, node in enumerate(self.nodes)]
+        generation = 0
+        while not all(fan.done() for fan in fans):
+            generation += 1
+            results = forEachNode(self.nodes, lambda node, fan: None if fan.done() else fan.step(), fans)
+            for i, (result, error, seconds) in enumerate(results):
+                logging.info("generation %d node %d: %d utxos in %.1f s" % (generation, i, result or 0, seconds))
+            raiseNodeErrors(results)
+            logging.info("mine blocks")
+            self.sync_all()
+            self.nodes[0].generate(1)  # mine all the created transactions
+            self.waiter.syncBlocks()
+            for fan in fans:
+                fan.confirmed()
+        for fan in fans:
+            fan.finish()
+        logging.info("sync all blocks and mempools")
+        self.sync_all()
+
+        self.waiter.close()
+        closeSigners()  # the signers and their workers belong to the stopped nodes
+        stop_nodes(self.nodes)
+        wait_bitcoinds()
+        self.snapshot.save(self.options.tmpdir, len(self.clientDirs),
+                           {"addrs": [self.addrs0, self.addrs1, self.addrs2, self.addrs3]})
+        self.setup_network()
+
+    def run_test(self):
+
+        #test_disconnect_bucash_node(self)
+        # Creating UTXOs needed for building tx for large blocks
+        if self.snapshotMeta:
+            self.addrs0, self.addrs1, self.addrs2, self.addrs3 = self.snapshotMeta["addrs"]
+        else:
+            self.setupUtxos()
+
+        if self.measureLatency:
+            self.recorder = PropagationRecorder(self.waiter, self.clientDirs)
 
         # TEST 1:  default values 
         test_default_values(self)
 
         # TEST 2: create Excessive block generated when this condition is met
         test_set_values_cmdline(self, fblksize=SIZE_32_MB, exblksize=SIZE_31_MB)
-        base = [x.getblockcount() for x in self.nodes]
+        base = NodeGroup(self.nodes).getblockcount()
         assert_equal(base, [base[0]] * 4)
 
         for i in range(0,15):
           self.nodes[3].generate(1)
-          time.sleep(1)
+          waitUntil(lambda: self.nodes[2].getblockcount() == self.nodes[3].getblockcount(), 60)
 
-        sync_blocks(self.nodes[2:])
-        sync_blocks(self.nodes[0:2])
+        self.waiter.syncBlocks(self.nodes[2:])
+        self.waiter.syncBlocks(self.nodes[0:2])
 
         # TEST 3: client refuses to include invalid op return txns in the first block
         nodeId1 = 1
         nodeId2 = 3
         test_generate_sighash(self, nodeId1, nodeId2, 1000, self.addrs0, data=TX_DATA)
+        # sendtoaddress spent coins behind the back of the UTXO pools
+        nodeUtxoPool(self.nodes[nodeId1]).reload()
+        nodeUtxoPool(self.nodes[nodeId2]).reload()
 
         # TEST 4: test client refuses to make a < 1MB fork block
         test_generate_badblock(self.nodes[0])
@@ -639,17 +764,19 @@ class LargeBlkTest(BitcoinTestFramework):
         node = self.nodes[0]
 
         # TEST REQ-3: generate a large block
+        if self.recorder:
+            self.recorder.mark("100000 bytes")
         generateTx(node, 100000, self.addrs0)
-        mostly_sync_mempools(self.nodes[0:2],difference=100, wait=2)
+        self.waiter.mostlySyncMempools(self.nodes[0:2], difference=100, grace=20)
 
         commonAncestor = node.getbestblockhash()
         node.generate(1)
         forkHeight = node.getblockcount()
         print("forkHeight: %d" % forkHeight)
         # Test that the forked nodes accept this block as the fork block
-        sync_blocks(self.nodes[0:2])
+        self.waiter.syncBlocks(self.nodes[0:2])
         # counts = [ x.getblockcount() for x in self.nodes[0:2] ]
-        counts = [x.getblockcount() for x in self.nodes]
+        counts = NodeGroup(self.nodes).getblockcount()
         logging.info(counts)
 
         # TEST 6: test client to generate large block
@@ -668,6 +795,8 @@ class LargeBlkTest(BitcoinTestFramework):
         # will cause CreateNewBlock: Excessive block generated:  (code 0)
         # because of  test_set_values_cmdline(self, fblksize=SIZE_32_MB, exblksize=SIZE_31_MB)
         test_generate_largeblock(self, id1, id2, SIZE_32_MB, self.addrs0, data=TX_DATA)
+        if self.recorder:
+            self.recorder.save(os.path.join(self.options.tmpdir, "latency.json"))
         reporter.display_report()
 
 def main(longTest):
@@ -685,7 +814,14 @@ def main(longTest):
         if "--tmpdir=" in arg:
             tmpdir = str(arg)
             logging.info("# User input : %s" %tmpdir)
-
+        if arg == "--assemble":
+            t.assembleBlocks = True
+            logging.info("Large blocks are assembled in the harness")
+        if arg == "--latency":
+            t.measureLatency = True
+            logging.info("Propagation latencies are measured")
+
+    t.bitcoinConf = bitcoinConf
     t.main([tmpdir], bitcoinConf, None)
 
 def Test(longTest=False):
@@ -267,15 +267,15 @@ class CTest(BitcoinTestFramework):
         logging.info("Verify that all nodes are connected")
         verifyInterconnect(self.nodes)
 
-        logging.info("block count: %s" % ([ x.getblockcount() for x in self.nodes]))
-        logging.info("Connection count: %s" % ([ x.getconnectioncount() for x in self.nodes]))
+        logging.info("block count: %s" % (NodeGroup(self.nodes).getblockcount()))
+        logging.info("Connection count: %s" % (NodeGroup(self.nodes).getconnectioncount()))
 
         logging.info("Verify that every node can produce blocks and that every other node receives them")
         for n in self.nodes:
             n.generate(num_blocks)
             sync_blocks(self.nodes)
 
-        logging.info("block count: %s" % ([ x.getblockcount() for x in self.nodes]))
+        logging.info("block count: %s" % (NodeGroup(self.nodes).getblockcount()))
 
         logging.info("Verify that every node can produce P2PKH transactions and that every other node receives them")
         # first get mature coins in every client
@@ -287,12 +287,12 @@ class CTest(BitcoinTestFramework):
             n.sendtoaddress(addr, 1)
             sync_mempools(self.nodes)
 
-        logging.info("mempool counts: %s" % [ x.getmempoolinfo()["size"] for x in self.nodes])
+        logging.info("mempool counts: %s" % [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()])
 
         logging.info("Verify that a block with P2PKH txns is accepted by all nodes and clears the mempool on all nodes")
         self.nodes[0].generate(1)
         sync_blocks(self.nodes)
-        logging.info("mempool counts: %s" % [ x.getmempoolinfo()["size"] for x in self.nodes])
+        logging.info("mempool counts: %s" % [info["size"] for info in NodeGroup(self.nodes).getmempoolinfo()])
 
         logging.info("******* Verify transaction amounts on different nodes ********* ")
         verify_amount_sendto_nodes(self, 0, 1, 10)